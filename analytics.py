@@ -0,0 +1,405 @@
+import hashlib
+import heapq
+import math
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _today() -> str:
+    return datetime.now().date().isoformat()
+
+
+class TrendingEngine:
+    """Sliding-window view counter with an incrementally maintained top-k.
+
+    Views are counted in one bucket per calendar day for the last ``days``
+    days, and ``_totals`` holds the per-movie sum over the window. Between day
+    rollovers counts only grow, so a movie can enter the top-k only through
+    its own increment and the top list is kept exact by a small insertion.
+    When a day leaves the window its bucket is subtracted and the top-k is
+    rebuilt once.
+    """
+
+    def __init__(self, days: int = 7, top_k: int = 50):
+        self.days = max(1, int(days))
+        self.top_k = max(1, int(top_k))
+        self._buckets: "OrderedDict[str, Dict[int, int]]" = OrderedDict()
+        self._totals: Dict[int, int] = {}
+        self._top: List[int] = []
+        self._current_day: Optional[str] = None
+        self.ready = False
+
+    def window_start(self, today: Optional[str] = None) -> str:
+        today = today or _today()
+        return (datetime.fromisoformat(today) - timedelta(days=self.days - 1)).date().isoformat()
+
+    def add(self, movie_id: int, count: int = 1, day: Optional[str] = None):
+        today = _today()
+        self._roll(today)
+        day = day or today
+        if day < self.window_start(today) or day > today:
+            return
+        movie_id = int(movie_id)
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = {}
+            self._buckets = OrderedDict(sorted(self._buckets.items()))
+        bucket[movie_id] = bucket.get(movie_id, 0) + count
+        self._totals[movie_id] = self._totals.get(movie_id, 0) + count
+        self._promote(movie_id)
+
+    def load(self, rows: Iterable[Tuple[int, str, int]]):
+        """Replace the window with ``(movie_id, day, views)`` rows."""
+        today = _today()
+        start = self.window_start(today)
+        buckets: Dict[str, Dict[int, int]] = {}
+        totals: Dict[int, int] = {}
+        for movie_id, day, views in rows:
+            if day < start or day > today or not views:
+                continue
+            movie_id = int(movie_id)
+            bucket = buckets.setdefault(day, {})
+            bucket[movie_id] = bucket.get(movie_id, 0) + int(views)
+            totals[movie_id] = totals.get(movie_id, 0) + int(views)
+        self._buckets = OrderedDict(sorted(buckets.items()))
+        self._totals = totals
+        self._current_day = today
+        self._rebuild_top()
+        self.ready = True
+
+    def top(self, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Return ``(movie_id, views)`` pairs, most viewed first."""
+        self._roll(_today())
+        ids = self._top if limit is None else self._top[:limit]
+        return [(movie_id, self._totals[movie_id]) for movie_id in ids]
+
+    def _promote(self, movie_id: int):
+        top = self._top
+        total = self._totals[movie_id]
+        if movie_id in top:
+            top.remove(movie_id)
+        elif len(top) >= self.top_k and total <= self._totals[top[-1]]:
+            return
+        index = len(top)
+        while index > 0 and self._totals[top[index - 1]] < total:
+            index -= 1
+        top.insert(index, movie_id)
+        del top[self.top_k:]
+
+    def _roll(self, today: str):
+        if self._current_day == today:
+            return
+        self._current_day = today
+        start = self.window_start(today)
+        expired = [day for day in self._buckets if day < start]
+        if not expired:
+            return
+        for day in expired:
+            for movie_id, count in self._buckets.pop(day).items():
+                remaining = self._totals.get(movie_id, 0) - count
+                if remaining > 0:
+                    self._totals[movie_id] = remaining
+                else:
+                    self._totals.pop(movie_id, None)
+        self._rebuild_top()
+
+    def _rebuild_top(self):
+        self._top = heapq.nlargest(self.top_k, self._totals, key=self._totals.__getitem__)
+
+
+def normalize_query(query: Optional[str]) -> str:
+    """Lowercase a search query and collapse whitespace, so "Avatar " == "avatar"."""
+    return " ".join((query or "").lower().split())
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters summary holding at most ``capacity`` counters.
+
+    When a new item arrives and the summary is full, the item with the
+    smallest count is evicted and the newcomer inherits that count (recorded
+    as its error). Every item whose true frequency exceeds ``N / capacity``
+    is guaranteed to be present. The minimum is found through a lazily
+    cleaned heap, so updates are O(log capacity).
+    """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = max(1, int(capacity))
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, item: str, count: int = 1):
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        error = 0
+        if len(self.counts) >= self.capacity:
+            error = self._evict_min()
+        self.counts[item] = error + count
+        self.errors[item] = error
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > self.capacity * 4:
+            self._heap = [(value, key) for key, value in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _evict_min(self) -> int:
+        while True:
+            value, item = heapq.heappop(self._heap)
+            current = self.counts.get(item)
+            if current is None:
+                continue
+            if current != value:
+                heapq.heappush(self._heap, (current, item))
+                continue
+            del self.counts[item]
+            del self.errors[item]
+            return value
+
+    def merge(self, other: "SpaceSaving"):
+        for item, count in other.counts.items():
+            if item in self.counts:
+                self.counts[item] += count
+                self.errors[item] += other.errors.get(item, 0)
+            else:
+                self.counts[item] = count
+                self.errors[item] = other.errors.get(item, 0)
+        if len(self.counts) > self.capacity:
+            keep = heapq.nlargest(self.capacity, self.counts, key=self.counts.__getitem__)
+            self.counts = {item: self.counts[item] for item in keep}
+            self.errors = {item: self.errors[item] for item in keep}
+        self._heap = [(value, key) for key, value in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        return heapq.nlargest(int(limit), self.counts.items(), key=lambda pair: pair[1])
+
+    def to_items(self) -> List[list]:
+        # Stored as [item, count, error] rows: queries may contain "." or "$",
+        # which are not valid MongoDB field names.
+        return [[item, count, self.errors.get(item, 0)] for item, count in self.counts.items()]
+
+    @classmethod
+    def from_items(cls, items: Iterable, capacity: int = 200) -> "SpaceSaving":
+        sketch = cls(capacity)
+        merged = cls(capacity)
+        for row in items or []:
+            item = normalize_query(row[0])
+            if not item:
+                continue
+            merged.counts[item] = merged.counts.get(item, 0) + int(row[1])
+            merged.errors[item] = merged.errors.get(item, 0) + int(row[2] if len(row) > 2 else 0)
+        sketch.merge(merged)
+        return sketch
+
+
+class DailySketches(ABC):
+    """Per-day mergeable sketches, split into this process's and everyone else's.
+
+    ``local`` holds the sketches this process writes (checkpointed under its
+    own instance id); ``remote`` holds the merged checkpoints of every other
+    instance. Days older than ``days`` are dropped. Subclasses supply the
+    sketch type through ``new_sketch`` and its checkpoint document fields
+    through ``to_document``/``from_document``.
+    """
+
+    def __init__(self, days: int = 30):
+        self.days = max(1, int(days))
+        self.local: Dict[str, object] = {}
+        self.remote: Dict[str, object] = {}
+        self.dirty_days = set()
+
+    @abstractmethod
+    def new_sketch(self):
+        """Return an empty sketch."""
+
+    @abstractmethod
+    def to_document(self, sketch) -> dict:
+        """Return the checkpoint fields for ``sketch``."""
+
+    @abstractmethod
+    def from_document(self, doc: dict):
+        """Rebuild a sketch from a checkpoint document."""
+
+    def load_documents(self, docs: Iterable[dict], instance_id: str, seed: bool = False):
+        """Replace ``remote`` with the other instances' checkpoints.
+
+        Our own checkpoint is only adopted with ``seed`` (on startup);
+        afterwards memory is newer than what was written.
+        """
+        remote: Dict[str, object] = {}
+        for doc in docs:
+            sketch = self.from_document(doc)
+            if doc.get("instance") == instance_id:
+                if seed:
+                    self.merge_local(doc["day"], sketch)
+            else:
+                remote.setdefault(doc["day"], self.new_sketch()).merge(sketch)
+        self.set_remote(remote)
+
+    def merge_local(self, day: str, sketch):
+        self.local.setdefault(day, self.new_sketch()).merge(sketch)
+        self._changed()
+
+    def set_remote(self, sketches: Dict[str, object]):
+        self.remote = sketches
+        self._changed()
+
+    def window_days(self, days: int, today: Optional[str] = None) -> List[str]:
+        end = datetime.fromisoformat(today or _today())
+        return [(end - timedelta(days=offset)).date().isoformat() for offset in range(int(days))]
+
+    def _today_sketch(self) -> Tuple[str, object]:
+        day = _today()
+        sketch = self.local.get(day)
+        if sketch is None:
+            sketch = self.local[day] = self.new_sketch()
+            self._prune(day)
+        return day, sketch
+
+    def _prune(self, today: str):
+        oldest = self.window_days(self.days, today)[-1]
+        for source in (self.local, self.remote):
+            for day in [day for day in source if day < oldest]:
+                del source[day]
+        self.dirty_days = {day for day in self.dirty_days if day >= oldest}
+        self._changed()
+
+    def _changed(self):
+        """Called whenever local or remote sketches are replaced or merged."""
+
+
+class SearchTopK(DailySketches):
+    """Per-day Space-Saving sketches of normalized search queries.
+
+    Windows ending today are answered by merging at most ``days`` bounded
+    sketches; the part of the window before today is cached per day.
+    """
+
+    def __init__(self, capacity: int = 200, days: int = 30):
+        super().__init__(days)
+        self.capacity = max(1, int(capacity))
+        self._past_cache: Dict[Tuple[int, str], SpaceSaving] = {}
+
+    def new_sketch(self) -> SpaceSaving:
+        return SpaceSaving(self.capacity)
+
+    def to_document(self, sketch: SpaceSaving) -> dict:
+        return {"items": sketch.to_items()}
+
+    def from_document(self, doc: dict) -> SpaceSaving:
+        return SpaceSaving.from_items(doc.get("items"), self.capacity)
+
+    def add(self, query: Optional[str]):
+        query = normalize_query(query)
+        if not query:
+            return
+        day, sketch = self._today_sketch()
+        sketch.add(query)
+        self.dirty_days.add(day)
+
+    def top(self, days: int, limit: int) -> List[Tuple[str, int]]:
+        today = _today()
+        days = max(1, min(int(days), self.days))
+        merged = SpaceSaving(self.capacity)
+        if days > 1:
+            merged.merge(self._past(days, today))
+        for source in (self.local, self.remote):
+            if today in source:
+                merged.merge(source[today])
+        return merged.top(limit)
+
+    def _past(self, days: int, today: str) -> SpaceSaving:
+        key = (days, today)
+        cached = self._past_cache.get(key)
+        if cached is None:
+            cached = SpaceSaving(self.capacity)
+            for day in self.window_days(days, today)[1:]:
+                for source in (self.local, self.remote):
+                    if day in source:
+                        cached.merge(source[day])
+            self._past_cache = {key: cached, **{k: v for k, v in self._past_cache.items() if k[1] == today}}
+        return cached
+
+    def _changed(self):
+        self._past_cache.clear()
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2 ** precision`` one-byte registers.
+
+    At the default precision of 12 a sketch is 4 KB with about 1.6% standard
+    error. Sketches merge by taking the register-wise maximum, so per-day and
+    per-process sketches combine into weekly/monthly or cluster-wide counts.
+    """
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = int(precision)
+        self.size = 1 << self.precision
+        if registers is not None and len(registers) == self.size:
+            self.registers = bytearray(registers)
+        else:
+            self.registers = bytearray(self.size)
+
+    def add(self, value) -> bool:
+        """Add ``value``; return True if the sketch changed."""
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = hashed & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class ActiveUserCounter(DailySketches):
+    """Per-day HyperLogLog sketches of active user ids (DAU/WAU/MAU)."""
+
+    def __init__(self, precision: int = 12, days: int = 30):
+        super().__init__(days)
+        self.precision = int(precision)
+
+    def new_sketch(self) -> HyperLogLog:
+        return HyperLogLog(self.precision)
+
+    def to_document(self, sketch: HyperLogLog) -> dict:
+        # bytes are stored as BSON binary.
+        return {"registers": sketch.to_bytes()}
+
+    def from_document(self, doc: dict) -> HyperLogLog:
+        return HyperLogLog(self.precision, bytes(doc.get("registers") or b""))
+
+    def add(self, user_id: int):
+        day, sketch = self._today_sketch()
+        if sketch.add(int(user_id)):
+            self.dirty_days.add(day)
+
+    def count(self, days: int) -> int:
+        merged = HyperLogLog(self.precision)
+        for day in self.window_days(min(int(days), self.days)):
+            for source in (self.local, self.remote):
+                if day in source:
+                    merged.merge(source[day])
+        return merged.count()
@@ -0,0 +1,371 @@
+import asyncio
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class SettingsCache:
+    """In-memory copy of the ``settings`` collection.
+
+    All settings are loaded with a single query and served from memory until
+    ``ttl`` seconds pass. Writes made through this process update the cached
+    value immediately; other processes pick them up on their next reload.
+    """
+
+    def __init__(self, collection, ttl: float = 60.0):
+        self.collection = collection
+        self.ttl = float(ttl)
+        self._values: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def reload(self):
+        docs = await self.collection.find({}, {"_id": 0, "key": 1, "value": 1}).to_list()
+        self._values = {doc["key"]: doc.get("value") for doc in docs if doc.get("key") is not None}
+        self._loaded_at = time.monotonic()
+
+    async def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.reload()
+        return self._values.get(key, default)
+
+    def set(self, key: str, value: str):
+        self._values[key] = value
+
+    def invalidate(self):
+        self._loaded_at = None
+
+
+class ChannelSnapshot:
+    """Process-wide list of active mandatory channels.
+
+    The whole active set is loaded with one query (sorted by ``id``) and
+    reused until ``ttl`` seconds pass or a write in this process calls
+    ``reload``. Callers must treat the returned documents as read-only.
+    """
+
+    def __init__(self, collection, ttl: float = 60.0):
+        self.collection = collection
+        self.ttl = float(ttl)
+        self._channels: List[dict] = []
+        self._by_channel_id: Dict[str, dict] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def reload(self):
+        docs = await self.collection.find({"is_active": 1}).sort("id", 1).to_list()
+        self._channels = docs
+        self._by_channel_id = {str(doc.get("channel_id")): doc for doc in docs}
+        self._loaded_at = time.monotonic()
+
+    async def _ensure_fresh(self):
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    await self.reload()
+
+    async def get(self) -> List[dict]:
+        await self._ensure_fresh()
+        return self._channels
+
+    async def get_map(self) -> Dict[str, dict]:
+        await self._ensure_fresh()
+        return self._by_channel_id
+
+    def invalidate(self):
+        self._loaded_at = None
+
+
+class MovieCache:
+    """Bounded LRU + TTL cache of movie documents, indexed by ``id`` and ``code``.
+
+    Documents are cached whether or not they are active, so ``is_active``
+    probes for removed titles are answered from memory too. ``hits`` and
+    ``misses`` count lookups for monitoring.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._by_id: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+        self._code_to_id: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def get(self, movie_id: int) -> Optional[dict]:
+        movie_id = int(movie_id)
+        entry = self._by_id.get(movie_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, doc = entry
+        if expires_at <= time.monotonic():
+            self._drop(movie_id)
+            self.misses += 1
+            return None
+        self._by_id.move_to_end(movie_id)
+        self.hits += 1
+        return doc
+
+    def get_by_code(self, code: str) -> Optional[dict]:
+        movie_id = self._code_to_id.get(code)
+        if movie_id is None:
+            self.misses += 1
+            return None
+        return self.get(movie_id)
+
+    def put(self, doc: Optional[dict]):
+        if not doc or doc.get("id") is None:
+            return
+        movie_id = int(doc["id"])
+        self._drop(movie_id)
+        self._by_id[movie_id] = (time.monotonic() + self.ttl, dict(doc))
+        if doc.get("code") is not None:
+            self._code_to_id[doc["code"]] = movie_id
+        while len(self._by_id) > self.max_size:
+            oldest_id, _ = next(iter(self._by_id.items()))
+            self._drop(oldest_id)
+
+    def add_views(self, movie_id: int, count: int):
+        entry = self._by_id.get(int(movie_id))
+        if entry is not None:
+            doc = entry[1]
+            doc["views"] = int(doc.get("views") or 0) + int(count)
+
+    def invalidate(self, movie_id: Optional[int] = None, code: Optional[str] = None):
+        if code is not None and movie_id is None:
+            movie_id = self._code_to_id.get(code)
+        if movie_id is not None:
+            self._drop(int(movie_id))
+        if code is not None:
+            self._code_to_id.pop(code, None)
+
+    def clear(self):
+        self._by_id.clear()
+        self._code_to_id.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _drop(self, movie_id: int):
+        entry = self._by_id.pop(movie_id, None)
+        if entry is None:
+            return
+        code = entry[1].get("code")
+        if code is not None and self._code_to_id.get(code) == movie_id:
+            del self._code_to_id[code]
+
+
+class EpisodeManifest:
+    """Compact, column-oriented episode list for one series.
+
+    Episode numbers live in a sorted ``array`` so lookups are a bisect and
+    pagination is a slice; the remaining fields are kept as parallel columns
+    and only turned into tuples on demand.
+    """
+
+    def __init__(self, docs: List[dict], fields: Tuple[str, ...], defaults: Dict):
+        docs = sorted(docs, key=lambda doc: int(doc.get("episode_number") or 0))
+        self.fields = fields
+        self.numbers = array("i", (int(doc.get("episode_number") or 0) for doc in docs))
+        self._columns = {
+            field: [doc.get(field, defaults.get(field)) for doc in docs]
+            for field in fields
+            if field != "episode_number"
+        }
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def _row(self, index: int) -> tuple:
+        return tuple(
+            self.numbers[index] if field == "episode_number" else self._columns[field][index]
+            for field in self.fields
+        )
+
+    def episode(self, episode_number: int) -> Optional[tuple]:
+        index = bisect_left(self.numbers, int(episode_number))
+        if index < len(self.numbers) and self.numbers[index] == int(episode_number):
+            return self._row(index)
+        return None
+
+    def episodes(self) -> List[tuple]:
+        return [self._row(index) for index in range(len(self.numbers))]
+
+
+class EpisodeManifestCache:
+    """Bounded LRU + TTL cache of ``EpisodeManifest`` objects keyed by movie id."""
+
+    def __init__(self, max_size: int = 500, ttl: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._manifests: "OrderedDict[int, Tuple[float, EpisodeManifest]]" = OrderedDict()
+
+    def get(self, movie_id: int) -> Optional[EpisodeManifest]:
+        movie_id = int(movie_id)
+        entry = self._manifests.get(movie_id)
+        if entry is None:
+            return None
+        expires_at, manifest = entry
+        if expires_at <= time.monotonic():
+            del self._manifests[movie_id]
+            return None
+        self._manifests.move_to_end(movie_id)
+        return manifest
+
+    def put(self, movie_id: int, manifest: EpisodeManifest):
+        movie_id = int(movie_id)
+        self._manifests.pop(movie_id, None)
+        self._manifests[movie_id] = (time.monotonic() + self.ttl, manifest)
+        while len(self._manifests) > self.max_size:
+            self._manifests.popitem(last=False)
+
+    def invalidate(self, movie_id: int):
+        self._manifests.pop(int(movie_id), None)
+
+    def clear(self):
+        self._manifests.clear()
+
+
+class PremiumCache:
+    """Bounded LRU cache of parsed ``premium_until`` values per user.
+
+    A premium entry stays valid until its own expiry moment, so active
+    subscribers are answered from memory until ``premium_until`` passes.
+    Non-premium entries are re-checked after ``ttl`` seconds so a premium
+    granted by another bot process is picked up.
+    """
+
+    def __init__(self, max_size: int = 50000, ttl: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._entries: "OrderedDict[int, Tuple[Optional[datetime], float]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Tuple[bool, Optional[datetime]]:
+        """Return ``(found, premium_until)``; ``premium_until`` is None for non-premium users."""
+        user_id = int(user_id)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False, None
+        premium_until, stored_at = entry
+        if premium_until is None and time.monotonic() - stored_at >= self.ttl:
+            del self._entries[user_id]
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, premium_until
+
+    def set(self, user_id: int, premium_until: Optional[datetime]):
+        user_id = int(user_id)
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = (premium_until, time.monotonic())
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(int(user_id), None)
+
+
+class SearchResultCache:
+    """Bounded LRU + TTL cache of search results keyed by normalized query.
+
+    Entries hold the ordered movie ids of a result, not the documents, and
+    are tagged with the catalog ``version`` they were computed against.
+    Moving to a new version drops every entry; results computed against an
+    older version are discarded instead of being stored.
+
+    Queries that found nothing go to a separate, larger LRU of keys so a
+    stream of one-off misses cannot evict the popular hits. Empty results
+    are exact, so a miss is only remembered until the catalog changes.
+    """
+
+    def __init__(self, max_size: int = 5000, ttl: float = 300.0, max_missing: int = 20000):
+        self.max_size = max(1, int(max_size))
+        self.max_missing = max(1, int(max_missing))
+        self.ttl = float(ttl)
+        self.version = 0
+        self._entries: "OrderedDict[tuple, Tuple[float, Tuple[int, ...], bool]]" = OrderedDict()
+        self._missing: "OrderedDict[tuple, float]" = OrderedDict()
+        self.negative_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_version(self, version: int):
+        version = int(version)
+        if version != self.version:
+            self.version = version
+            self.clear()
+
+    def get(self, key: tuple) -> Optional[Tuple[Tuple[int, ...], bool]]:
+        """Return ``(movie_ids, is_fuzzy)`` or None on a miss."""
+        expires_at = self._missing.get(key)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                self._missing.move_to_end(key)
+                self.negative_hits += 1
+                return (), True
+            del self._missing[key]
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, movie_ids, is_fuzzy = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return movie_ids, is_fuzzy
+
+    def put(self, key: tuple, movie_ids: List[int], is_fuzzy: bool, version: int):
+        if int(version) != self.version:
+            return
+        if not movie_ids:
+            self._missing.pop(key, None)
+            self._missing[key] = time.monotonic() + self.ttl
+            while len(self._missing) > self.max_missing:
+                self._missing.popitem(last=False)
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, tuple(movie_ids), bool(is_fuzzy))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self._missing.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "missing": len(self._missing),
+            "version": self.version,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -1,19 +1,302 @@
+import asyncio
 import difflib
+import functools
+import inspect
 import logging
 import os
 import random
 import re
 import sqlite3
+import threading
+import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
-from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument
-from pymongo.errors import DuplicateKeyError
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, DeleteMany, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from analytics import ActiveUserCounter, SearchTopK, SpaceSaving, TrendingEngine, normalize_query
+from search_index import CategorySampler, PrefixTrie, TitleIndex, TrigramMatcher, normalize_title
+from cache import (
+    ChannelSnapshot,
+    EpisodeManifest,
+    EpisodeManifestCache,
+    MovieCache,
+    PremiumCache,
+    SearchResultCache,
+    SettingsCache,
+)
 
 logger = logging.getLogger(__name__)
 
 
-class Database:
+class IdAllocator:
+    """Hi/lo id allocator on top of the shared ``counters`` collection.
+
+    Each refill reserves ``block_size`` ids with one atomic ``$inc``, so any
+    number of bot processes can share a counter without handing out the same
+    id twice; ids are then served from memory until the block runs out.
+    """
+
+    def __init__(self, counters, counter_name: str, block_size: int = 1):
+        self.counters = counters
+        self.counter_name = counter_name
+        self.block_size = max(1, int(block_size))
+        self._next = 0
+        self._limit = 0
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if self._next >= self._limit:
+            async with self._lock:
+                if self._next >= self._limit:
+                    await self._reserve_block()
+        value = self._next
+        self._next += 1
+        return value
+
+    async def _reserve_block(self):
+        counter = await self.counters.find_one_and_update(
+            {"_id": self.counter_name},
+            {"$inc": {"seq": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        high = int(counter.get("seq", self.block_size))
+        self._next = high - self.block_size + 1
+        self._limit = high + 1
+
+    def reset(self):
+        self._next = 0
+        self._limit = 0
+
+
+class StatsBuffer:
+    """Write-behind buffer for search and view statistics.
+
+    Events are collected in memory and written by ``flush()``: one
+    ``insert_many`` per statistics collection plus one ``bulk_write`` of
+    aggregated ``$inc`` updates on ``users``. Movie view counters and the
+    ``movie_views_daily`` rollups are coalesced per movie (and day) the same
+    way, so a viral title gets one ``$inc`` per flush instead of one per
+    open. A background task flushes every ``flush_interval`` seconds, a full
+    buffer triggers an early flush, and ``stop()`` flushes whatever is left.
+    """
+
+    def __init__(self, database: "AsyncDatabase", max_events: int = 500, flush_interval: float = 5.0):
+        self.database = database
+        self.max_events = max(1, int(max_events))
+        self.flush_interval = max(0.1, float(flush_interval))
+        self._searches: List[dict] = []
+        self._views: List[dict] = []
+        self._user_incs: Dict[int, Dict[str, int]] = {}
+        self._daily_views: Dict[Tuple[int, str], int] = {}
+        self._movie_views: Dict[int, int] = {}
+        self._movie_views_inflight: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._size_flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._searches) + len(self._views)
+
+    def add_search(self, user_id: int, query: str, found: bool):
+        self._searches.append(
+            {
+                "user_id": int(user_id),
+                "query": query,
+                "found": 1 if found else 0,
+                "search_date": datetime.now().isoformat(),
+            }
+        )
+        self._inc_user(user_id, "total_searches")
+        self._maybe_flush()
+
+    def add_view(self, user_id: int, movie_id: int):
+        view_date = datetime.now().isoformat()
+        self._views.append(
+            {
+                "user_id": int(user_id),
+                "movie_id": int(movie_id),
+                "view_date": view_date,
+            }
+        )
+        key = (int(movie_id), view_date[:10])
+        self._daily_views[key] = self._daily_views.get(key, 0) + 1
+        self._inc_user(user_id, "total_views")
+        self._maybe_flush()
+
+    def add_movie_view(self, movie_id: int):
+        movie_id = int(movie_id)
+        self._movie_views[movie_id] = self._movie_views.get(movie_id, 0) + 1
+
+    def pending_counts(self) -> Tuple[int, int]:
+        """Return ``(searches, views)`` recorded but not yet written."""
+        return len(self._searches), len(self._views)
+
+    def pending_movie_views(self, movie_id: int) -> int:
+        movie_id = int(movie_id)
+        return self._movie_views.get(movie_id, 0) + self._movie_views_inflight.get(movie_id, 0)
+
+    def _inc_user(self, user_id: int, field: str):
+        incs = self._user_incs.setdefault(int(user_id), {})
+        incs[field] = incs.get(field, 0) + 1
+
+    def _maybe_flush(self):
+        if len(self) < self.max_events:
+            return
+        if self._size_flush_task is None or self._size_flush_task.done():
+            self._size_flush_task = asyncio.create_task(self._safe_flush())
+
+    def start(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self._safe_flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._safe_flush()
+
+    async def _safe_flush(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Stats flush failed")
+
+    async def flush(self):
+        async with self._flush_lock:
+            searches, self._searches = self._searches, []
+            views, self._views = self._views, []
+            user_incs, self._user_incs = self._user_incs, {}
+            db = self.database.db
+
+            try:
+                # Ids are assigned once, so a retried insert_many is idempotent.
+                for event in searches:
+                    if "id" not in event:
+                        event["id"] = await self.database._next_id("search_statistics")
+                for event in views:
+                    if "id" not in event:
+                        event["id"] = await self.database._next_id("view_statistics")
+            except PyMongoError as exc:
+                logger.error("Stats flush: id allocation failed: %s", exc)
+                self._searches[:0] = searches
+                self._views[:0] = views
+                self._restore_user_incs(user_incs)
+            else:
+                await self._flush_events(db, searches, views, user_incs)
+
+            await self._flush_daily_views(db)
+            await self._flush_movie_views(db)
+            self._trim()
+
+    async def _flush_events(self, db, searches: List[dict], views: List[dict], user_incs: Dict[int, Dict[str, int]]):
+        totals = {}
+        if await self._insert_events(db.search_statistics, searches):
+            totals["total_searches"] = len(searches)
+        else:
+            self._searches[:0] = searches
+        if await self._insert_events(db.view_statistics, views):
+            totals["total_views"] = len(views)
+        else:
+            self._views[:0] = views
+        try:
+            await self.database._bump_stats(**totals)
+        except PyMongoError as exc:
+            logger.error("Stats flush: totals update failed: %s", exc)
+
+        if user_incs:
+            requests = [UpdateOne({"user_id": user_id}, {"$inc": incs}) for user_id, incs in user_incs.items()]
+            try:
+                await db.users.bulk_write(requests, ordered=False)
+            except PyMongoError as exc:
+                logger.error("Stats flush: user counters failed: %s", exc)
+                self._restore_user_incs(user_incs)
+
+    def _restore_user_incs(self, user_incs: Dict[int, Dict[str, int]]):
+        for user_id, incs in user_incs.items():
+            pending = self._user_incs.setdefault(user_id, {})
+            for field, value in incs.items():
+                pending[field] = pending.get(field, 0) + value
+
+    async def _flush_daily_views(self, db):
+        if not self._daily_views:
+            return
+        daily_views, self._daily_views = self._daily_views, {}
+        requests = [
+            UpdateOne({"movie_id": movie_id, "day": day}, {"$inc": {"views": count}}, upsert=True)
+            for (movie_id, day), count in daily_views.items()
+        ]
+        try:
+            await db.movie_views_daily.bulk_write(requests, ordered=False)
+        except PyMongoError as exc:
+            logger.error("Stats flush: daily view rollups failed: %s", exc)
+            for key, count in daily_views.items():
+                self._daily_views[key] = self._daily_views.get(key, 0) + count
+
+    async def _flush_movie_views(self, db):
+        if not self._movie_views:
+            return
+        # In-flight counts stay visible to pending_movie_views() until the
+        # write lands, so readers never see the counter dip.
+        self._movie_views_inflight, self._movie_views = self._movie_views, {}
+        requests = [
+            UpdateOne({"id": movie_id, "is_active": 1}, {"$inc": {"views": count}})
+            for movie_id, count in self._movie_views_inflight.items()
+        ]
+        try:
+            await db.movies.bulk_write(requests, ordered=False)
+        except PyMongoError as exc:
+            logger.error("Stats flush: movie views failed: %s", exc)
+            for movie_id, count in self._movie_views_inflight.items():
+                self._movie_views[movie_id] = self._movie_views.get(movie_id, 0) + count
+        else:
+            for movie_id, count in self._movie_views_inflight.items():
+                self.database.movie_cache.add_views(movie_id, count)
+                self.database.title_index.add_views(movie_id, count)
+                self.database.title_trie.add_views(movie_id, count)
+        finally:
+            self._movie_views_inflight = {}
+
+    @staticmethod
+    async def _insert_events(collection, events: List[dict]) -> bool:
+        if not events:
+            return True
+        try:
+            await collection.insert_many(events, ordered=False)
+            return True
+        except BulkWriteError as exc:
+            # Duplicate ids mean a previous attempt already stored those events.
+            errors = exc.details.get("writeErrors", [])
+            if all(err.get("code") == 11000 for err in errors):
+                return True
+            logger.error("Stats flush: %s insert failed: %s", collection.name, exc)
+            return False
+        except PyMongoError as exc:
+            logger.error("Stats flush: %s insert failed: %s", collection.name, exc)
+            return False
+
+    def _trim(self):
+        # Keep memory bounded if MongoDB stays unreachable for a long time.
+        limit = self.max_events * 20
+        for name in ("_searches", "_views"):
+            events = getattr(self, name)
+            if len(events) > limit:
+                logger.warning("Stats buffer overflow: dropping %s buffered %s", len(events) - limit, name[1:])
+                del events[: len(events) - limit]
+
+
+class AsyncDatabase:
     USER_FIELDS = (
         "user_id",
         "username",
@@ -132,6 +415,21 @@ class Database:
         "transaction_date": None,
     }
 
+    # Statistics counters are written on every search/view, so they reserve ids
+    # in large blocks. Catalog and payment ids stay dense (one id per refill).
+    ID_BLOCK_SIZES = {
+        "search_statistics": int(os.getenv("ID_BLOCK_SIZE", "1000")),
+        "view_statistics": int(os.getenv("ID_BLOCK_SIZE", "1000")),
+    }
+
+    # Refreshes skipped for an unchanged catalog before the indexes are rebuilt
+    # anyway, compacting patched structures and picking up view counts.
+    TITLE_INDEX_MAX_SKIPS = int(os.getenv("TITLE_INDEX_MAX_SKIPS", "12"))
+
+    # user_subscriptions rows are only read back by _pick_daily_channels' 7-day
+    # window, so each row expires this many days after its rotation_day.
+    SUBSCRIPTION_RETENTION_DAYS = int(os.getenv("SUBSCRIPTION_RETENTION_DAYS", "8"))
+
     def __init__(
         self,
         mongo_uri: Optional[str] = None,
@@ -150,69 +448,235 @@ class Database:
             "card_owner": default_card_owner,
         }
 
-        self.client = MongoClient(self.mongo_uri)
+        self.client = AsyncMongoClient(self.mongo_uri)
         self.db = self.client[self.mongo_db_name]
-        self.init_database()
-
-        if os.getenv("MIGRATE_SQLITE_ON_START", "0") == "1":
-            self.migrate_from_sqlite(self.sqlite_fallback_path)
-
-    def init_database(self):
-        self.db.users.create_index([("user_id", ASCENDING)], unique=True)
-        self.db.channels.create_index([("id", ASCENDING)], unique=True)
-        self.db.channels.create_index([("channel_id", ASCENDING)], unique=True)
-        self.db.channels.create_index([("channel_type", ASCENDING), ("is_active", ASCENDING)])
-        self.db.user_subscriptions.create_index(
+        self._id_allocators: Dict[str, IdAllocator] = {}
+        self.stats_buffer = StatsBuffer(
+            self,
+            max_events=int(os.getenv("STATS_FLUSH_SIZE", "500")),
+            flush_interval=float(os.getenv("STATS_FLUSH_INTERVAL", "5")),
+        )
+        self.settings_cache = SettingsCache(self.db.settings, ttl=float(os.getenv("SETTINGS_CACHE_TTL", "60")))
+        self.channel_snapshot = ChannelSnapshot(self.db.channels, ttl=float(os.getenv("CHANNEL_CACHE_TTL", "60")))
+        self.movie_cache = MovieCache(
+            max_size=int(os.getenv("MOVIE_CACHE_SIZE", "2000")),
+            ttl=float(os.getenv("MOVIE_CACHE_TTL", "300")),
+        )
+        self.episode_cache = EpisodeManifestCache(
+            max_size=int(os.getenv("EPISODE_CACHE_SIZE", "500")),
+            ttl=float(os.getenv("EPISODE_CACHE_TTL", "300")),
+        )
+        self.premium_cache = PremiumCache(
+            max_size=int(os.getenv("PREMIUM_CACHE_SIZE", "50000")),
+            ttl=float(os.getenv("PREMIUM_CACHE_TTL", "300")),
+        )
+        self.search_cache = SearchResultCache(
+            max_size=int(os.getenv("SEARCH_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+            max_missing=int(os.getenv("SEARCH_NEGATIVE_CACHE_SIZE", "20000")),
+        )
+        self.title_index = TitleIndex()
+        self.title_matcher = TrigramMatcher()
+        self.title_trie = PrefixTrie(top_k=int(os.getenv("INLINE_TOP_K", "20")))
+        self.category_sampler = CategorySampler()
+        # While the title indexes are rebuilt, catalog changes are recorded here
+        # and replayed onto the new index so none are lost to the swap.
+        self._catalog_changes: Optional[List[Tuple[str, object]]] = None
+        self._title_index_lock = asyncio.Lock()
+        # Catalog version the live indexes were built against.
+        self._title_index_version: Optional[int] = None
+        self._title_index_skips = 0
+        self.trending = TrendingEngine(
+            days=int(os.getenv("TRENDING_DAYS", "7")),
+            top_k=int(os.getenv("TRENDING_TOP_K", "50")),
+        )
+        self.search_trends = SearchTopK(
+            capacity=int(os.getenv("SEARCH_SKETCH_CAPACITY", "200")),
+            days=30,
+        )
+        self.active_users = ActiveUserCounter(precision=12, days=30)
+        # Identifies this process's analytics checkpoints, so several bot
+        # processes can write side by side and merge on read.
+        self.instance_id = os.getenv("INSTANCE_ID") or uuid.uuid4().hex[:12]
+        self._jobs: List[asyncio.Task] = []
+        self._sketches_seeded = False
+        # Users whose last_gate_day this process already wrote for _gate_day.
+        self._gate_day: Optional[str] = None
+        self._gate_seen: set = set()
+
+    # (collection, keys, options) for every index the bot relies on.
+    INDEXES = (
+        ("users", [("user_id", ASCENDING)], {"unique": True}),
+        ("users", [("last_rotation_date", DESCENDING)], {}),
+        ("users", [("last_gate_day", DESCENDING)], {}),
+        ("channels", [("id", ASCENDING)], {"unique": True}),
+        ("channels", [("channel_id", ASCENDING)], {"unique": True}),
+        ("channels", [("channel_type", ASCENDING), ("is_active", ASCENDING)], {}),
+        (
+            "user_subscriptions",
             [("user_id", ASCENDING), ("channel_id", ASCENDING), ("rotation_day", ASCENDING)],
-            unique=True,
+            {"unique": True},
+        ),
+        ("user_subscriptions", [("user_id", ASCENDING), ("rotation_day", ASCENDING)], {}),
+        ("user_subscriptions", [("rotation_day", ASCENDING)], {}),
+        ("user_subscriptions", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+        ("movies", [("id", ASCENDING)], {"unique": True}),
+        ("movies", [("code", ASCENDING)], {"unique": True}),
+        ("movies", [("category", ASCENDING), ("is_active", ASCENDING)], {}),
+        ("movies", [("is_active", ASCENDING), ("views", DESCENDING)], {}),
+        ("movies", [("source_chat_id", ASCENDING), ("source_message_id", ASCENDING)], {}),
+        ("movies", [("title_norm", ASCENDING)], {}),
+        ("series_episodes", [("id", ASCENDING)], {"unique": True}),
+        ("series_episodes", [("movie_id", ASCENDING), ("episode_number", ASCENDING)], {"unique": True}),
+        ("series_episodes", [("source_chat_id", ASCENDING), ("source_message_id", ASCENDING)], {}),
+        ("search_statistics", [("id", ASCENDING)], {"unique": True}),
+        ("search_statistics", [("search_date", DESCENDING)], {}),
+        ("search_statistics", [("user_id", ASCENDING), ("search_date", DESCENDING)], {}),
+        ("view_statistics", [("id", ASCENDING)], {"unique": True}),
+        ("view_statistics", [("movie_id", ASCENDING), ("view_date", DESCENDING)], {}),
+        ("movie_views_daily", [("movie_id", ASCENDING), ("day", ASCENDING)], {"unique": True}),
+        ("movie_views_daily", [("day", ASCENDING), ("movie_id", ASCENDING)], {}),
+        ("payment_transactions", [("id", ASCENDING)], {"unique": True}),
+        ("payment_transactions", [("status", ASCENDING), ("transaction_date", DESCENDING)], {}),
+        ("settings", [("key", ASCENDING)], {"unique": True}),
+        ("search_sketches", [("day", ASCENDING), ("instance", ASCENDING)], {"unique": True}),
+        ("search_sketches", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+        ("activity_sketches", [("day", ASCENDING), ("instance", ASCENDING)], {"unique": True}),
+        ("activity_sketches", [("expires_at", ASCENDING)], {"expireAfterSeconds": 0}),
+    )
+
+    async def start(self):
+        """Start background jobs; with FAST_STARTUP (default) warm up in the background."""
+        self.stats_buffer.start()
+        self._spawn(
+            self._every(float(os.getenv("TRENDING_RESYNC_INTERVAL", "300")), self.sync_trending, "Trending resync")
         )
-        self.db.user_subscriptions.create_index([("user_id", ASCENDING), ("rotation_day", ASCENDING)])
-        self.db.movies.create_index([("id", ASCENDING)], unique=True)
-        self.db.movies.create_index([("code", ASCENDING)], unique=True)
-        self.db.movies.create_index([("category", ASCENDING), ("is_active", ASCENDING)])
-        self.db.movies.create_index([("is_active", ASCENDING), ("views", DESCENDING)])
-        self.db.movies.create_index([("source_chat_id", ASCENDING), ("source_message_id", ASCENDING)])
-        self.db.series_episodes.create_index([("id", ASCENDING)], unique=True)
-        self.db.series_episodes.create_index([("movie_id", ASCENDING), ("episode_number", ASCENDING)], unique=True)
-        self.db.series_episodes.create_index([("source_chat_id", ASCENDING), ("source_message_id", ASCENDING)])
-        self.db.search_statistics.create_index([("id", ASCENDING)], unique=True)
-        self.db.search_statistics.create_index([("search_date", DESCENDING)])
-        self.db.search_statistics.create_index([("user_id", ASCENDING), ("search_date", DESCENDING)])
-        self.db.view_statistics.create_index([("id", ASCENDING)], unique=True)
-        self.db.view_statistics.create_index([("movie_id", ASCENDING), ("view_date", DESCENDING)])
-        self.db.payment_transactions.create_index([("id", ASCENDING)], unique=True)
-        self.db.payment_transactions.create_index([("status", ASCENDING), ("transaction_date", DESCENDING)])
-        self.db.settings.create_index([("key", ASCENDING)], unique=True)
-
-        for key, value in self.default_settings.items():
-            self.db.settings.update_one(
-                {"key": key},
-                {"$setOnInsert": {"value": str(value)}},
-                upsert=True,
+        self._spawn(
+            self._every(float(os.getenv("STATS_RECONCILE_INTERVAL", "3600")), self.reconcile_stats, "Stats reconcile")
+        )
+        self._spawn(
+            self._every(
+                float(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", "300")),
+                self.rebuild_title_index,
+                "Title index refresh",
             )
+        )
+        self._spawn(
+            self._every(
+                float(os.getenv("CATALOG_VERSION_SYNC_INTERVAL", "10")),
+                self.sync_catalog_version,
+                "Catalog version sync",
+            )
+        )
+        if os.getenv("PRECOMPUTE_ROTATIONS", "0") == "1":
+            self._spawn(self._rotation_precompute_loop(int(os.getenv("PRECOMPUTE_ROTATIONS_HOUR", "23"))))
+        self._spawn(self._every(86400, self.purge_old_subscriptions, "Subscription purge", initial_delay=60))
+
+        if os.getenv("FAST_STARTUP", "1") == "1":
+            self._spawn(self._warm_up_logged())
+        else:
+            await self._warm_up(retry=False)
+
+    async def _warm_up(self, retry: bool = True):
+        for label, job in (
+            ("Index check", self.init_database),
+            ("Catalog version sync", self.sync_catalog_version),
+            ("Title norm backfill", self.backfill_title_norms),
+            ("Title index build", self.rebuild_title_index),
+            ("Trending warm-up", self.sync_trending),
+        ):
+            await self._run_with_backoff(label, job, retry)
+        if retry:
+            await self._seed_analytics()
+        else:
+            self._spawn(self._seed_analytics())
 
-        logger.info("MongoDB initialized successfully")
+        if os.getenv("MIGRATE_SQLITE_ON_START", "0") == "1":
+            await self.migrate_from_sqlite(self.sqlite_fallback_path)
 
-    def _next_id(self, counter_name: str) -> int:
-        counter = self.db.counters.find_one_and_update(
-            {"_id": counter_name},
-            {"$inc": {"seq": 1}},
-            upsert=True,
-            return_document=ReturnDocument.AFTER,
+    @staticmethod
+    async def _run_with_backoff(label: str, job, retry: bool = True, max_delay: float = 60.0):
+        delay = 1.0
+        while True:
+            try:
+                await job()
+                return
+            except PyMongoError as exc:
+                logger.error("%s failed: %s", label, exc)
+                if not retry:
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_delay)
+
+    async def _seed_analytics(self):
+        await self._run_with_backoff("Search sketch warm-up", functools.partial(self.load_search_sketches, seed=True))
+        await self._run_with_backoff("Activity sketch warm-up", functools.partial(self.load_activity_sketches, seed=True))
+        # Checkpointing before the seed load would merge our own document back
+        # into local counts, so the sync loop only starts now.
+        self._sketches_seeded = True
+        self._spawn(
+            self._every(
+                float(os.getenv("ANALYTICS_SYNC_INTERVAL", "60")),
+                self.sync_analytics,
+                "Analytics sketch sync",
+            )
+        )
+
+    async def _warm_up_logged(self):
+        try:
+            await self._warm_up()
+        except Exception:
+            logger.exception("Database warm-up failed")
+
+    async def init_database(self):
+        """Create missing indexes: one list_indexes per collection, then one create_indexes."""
+        models: Dict[str, List[IndexModel]] = {}
+        for collection_name, keys, options in self.INDEXES:
+            models.setdefault(collection_name, []).append(IndexModel(keys, **options))
+        created = await asyncio.gather(
+            *(self._ensure_indexes(collection_name, wanted) for collection_name, wanted in models.items())
         )
-        return int(counter.get("seq", 1))
+        logger.info("MongoDB initialized successfully (%s indexes created)", sum(created))
+
+    @staticmethod
+    def _index_key(key) -> tuple:
+        return tuple((field, int(value) if isinstance(value, (int, float)) else value) for field, value in key.items())
+
+    async def _ensure_indexes(self, collection_name: str, wanted: List[IndexModel]) -> int:
+        collection = self.db[collection_name]
+        cursor = await collection.list_indexes()
+        existing = {self._index_key(doc["key"]) for doc in await cursor.to_list()}
+        missing = [model for model in wanted if self._index_key(model.document["key"]) not in existing]
+        if missing:
+            await collection.create_indexes(missing)
+        return len(missing)
+
+    async def _next_id(self, counter_name: str) -> int:
+        allocator = self._id_allocators.get(counter_name)
+        if allocator is None:
+            allocator = IdAllocator(
+                self.db.counters,
+                counter_name,
+                block_size=self.ID_BLOCK_SIZES.get(counter_name, 1),
+            )
+            self._id_allocators[counter_name] = allocator
+        return await allocator.next_id()
 
-    def _set_counter_floor(self, counter_name: str, floor_value: int):
+    async def _set_counter_floor(self, counter_name: str, floor_value: int):
         if floor_value <= 0:
             return
-        current = self.db.counters.find_one({"_id": counter_name})
+        current = await self.db.counters.find_one({"_id": counter_name})
         current_seq = int(current.get("seq", 0)) if current else 0
         if current_seq < floor_value:
-            self.db.counters.update_one(
+            await self.db.counters.update_one(
                 {"_id": counter_name},
                 {"$set": {"seq": int(floor_value)}},
                 upsert=True,
             )
+            # A block reserved before the floor moved may overlap migrated ids.
+            allocator = self._id_allocators.get(counter_name)
+            if allocator is not None:
+                allocator.reset()
 
     @staticmethod
     def _extract_day(value: Optional[str]) -> Optional[str]:
@@ -252,7 +716,14 @@ class Database:
         return self._doc_to_tuple(doc, self.CHANNEL_FIELDS, self.CHANNEL_DEFAULTS)
 
     def _movie_tuple(self, doc: Optional[dict]) -> Optional[tuple]:
-        return self._doc_to_tuple(doc, self.MOVIE_FIELDS, self.MOVIE_DEFAULTS)
+        movie = self._doc_to_tuple(doc, self.MOVIE_FIELDS, self.MOVIE_DEFAULTS)
+        if movie is None or movie[0] is None:
+            return movie
+        # Report persisted + buffered views so captions stay fresh between flushes.
+        pending = self.stats_buffer.pending_movie_views(movie[0])
+        if pending:
+            movie = movie[:10] + (int(movie[10] or 0) + pending,) + movie[11:]
+        return movie
 
     def _episode_tuple(self, doc: Optional[dict]) -> Optional[tuple]:
         return self._doc_to_tuple(doc, self.EPISODE_FIELDS, self.EPISODE_DEFAULTS)
@@ -260,15 +731,41 @@ class Database:
     def _payment_tuple(self, doc: Optional[dict]) -> Optional[tuple]:
         return self._doc_to_tuple(doc, self.PAYMENT_FIELDS, self.PAYMENT_DEFAULTS)
 
-    def get_setting(self, key: str, default: str | None = None) -> str | None:
-        row = self.db.settings.find_one({"key": key}, {"value": 1})
-        return row.get("value") if row else default
-
-    def set_setting(self, key: str, value: str):
-        self.db.settings.update_one({"key": key}, {"$set": {"value": value}}, upsert=True)
-
-    def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
-        self.db.users.update_one(
+    async def _get_movie_doc(self, movie_id: int) -> Optional[dict]:
+        doc = self.movie_cache.get(movie_id)
+        if doc is None:
+            doc = await self.db.movies.find_one({"id": int(movie_id)})
+            self.movie_cache.put(doc)
+        return doc
+
+    async def _get_movie_doc_by_code(self, code: str) -> Optional[dict]:
+        doc = self.movie_cache.get_by_code(code)
+        if doc is None:
+            doc = await self.db.movies.find_one({"code": code})
+            self.movie_cache.put(doc)
+        return doc
+
+    async def _get_active_movie_doc(self, movie_id: int, active_only: bool = True) -> Optional[dict]:
+        doc = await self._get_movie_doc(movie_id)
+        if doc and active_only and doc.get("is_active") != 1:
+            return None
+        return doc
+
+    async def get_setting(self, key: str, default: str | None = None) -> str | None:
+        value = await self.settings_cache.get(key)
+        if value is None and key in self.default_settings:
+            # Defaults are seeded on first read instead of at startup.
+            value = str(self.default_settings[key])
+            await self.db.settings.update_one({"key": key}, {"$setOnInsert": {"value": value}}, upsert=True)
+            self.settings_cache.set(key, value)
+        return default if value is None else value
+
+    async def set_setting(self, key: str, value: str):
+        await self.db.settings.update_one({"key": key}, {"$set": {"value": value}}, upsert=True)
+        self.settings_cache.set(key, value)
+
+    async def add_user(self, user_id: int, username: str, first_name: str, last_name: str = None):
+        result = await self.db.users.update_one(
             {"user_id": int(user_id)},
             {
                 "$setOnInsert": {
@@ -286,41 +783,70 @@ class Database:
             },
             upsert=True,
         )
+        if result.upserted_id is not None:
+            await self._bump_stats(total_users=1)
 
-    def get_user(self, user_id: int) -> Optional[tuple]:
-        doc = self.db.users.find_one({"user_id": int(user_id)})
+    async def get_user(self, user_id: int) -> Optional[tuple]:
+        doc = await self.db.users.find_one({"user_id": int(user_id)})
         return self._user_tuple(doc)
 
-    def is_premium(self, user_id: int) -> bool:
-        user = self.get_user(user_id)
-        if user and user[5] == 1:
-            if user[6]:
+    async def is_premium(self, user_id: int) -> bool:
+        found, premium_until = self.premium_cache.get(user_id)
+        if found:
+            if premium_until is None:
+                return False
+            if premium_until > datetime.now():
+                return True
+            # Cached expiry has passed: re-read in case it was extended elsewhere.
+
+        doc = await self.db.users.find_one(
+            {"user_id": int(user_id)},
+            {"_id": 0, "is_premium": 1, "premium_until": 1},
+        )
+        if doc and doc.get("is_premium") == 1:
+            if doc.get("premium_until"):
                 try:
-                    premium_until = datetime.fromisoformat(user[6])
+                    premium_until = datetime.fromisoformat(doc["premium_until"])
                 except ValueError:
-                    self.remove_premium(user_id)
+                    await self.remove_premium(user_id)
                     return False
                 if premium_until > datetime.now():
+                    self.premium_cache.set(user_id, premium_until)
                     return True
-                self.remove_premium(user_id)
+                await self.remove_premium(user_id)
+                return False
+        self.premium_cache.set(user_id, None)
         return False
 
-    def add_premium(self, user_id: int, days: int = 30):
-        premium_until = (datetime.now() + timedelta(days=days)).isoformat()
-        self.db.users.update_one(
+    async def add_premium(self, user_id: int, days: int = 30):
+        premium_until = datetime.now() + timedelta(days=days)
+        before = await self.db.users.find_one_and_update(
             {"user_id": int(user_id)},
-            {"$set": {"is_premium": 1, "premium_until": premium_until}},
+            {"$set": {"is_premium": 1, "premium_until": premium_until.isoformat()}},
+            projection={"_id": 0, "is_premium": 1},
+            return_document=ReturnDocument.BEFORE,
         )
+        if before is None:
+            self.premium_cache.invalidate(user_id)
+            return
+        self.premium_cache.set(user_id, premium_until)
+        if before.get("is_premium") != 1:
+            await self._bump_stats(premium_users=1)
 
-    def remove_premium(self, user_id: int):
-        self.db.users.update_one(
+    async def remove_premium(self, user_id: int):
+        before = await self.db.users.find_one_and_update(
             {"user_id": int(user_id)},
             {"$set": {"is_premium": 0, "premium_until": None}},
+            projection={"_id": 0, "is_premium": 1},
+            return_document=ReturnDocument.BEFORE,
         )
+        self.premium_cache.set(user_id, None)
+        if before is not None and before.get("is_premium") == 1:
+            await self._bump_stats(premium_users=-1)
 
-    def create_payment(self, user_id: int, amount: int, payment_type: str = "card") -> int:
-        payment_id = self._next_id("payment_transactions")
-        self.db.payment_transactions.insert_one(
+    async def create_payment(self, user_id: int, amount: int, payment_type: str = "card") -> int:
+        payment_id = await self._next_id("payment_transactions")
+        await self.db.payment_transactions.insert_one(
             {
                 "id": payment_id,
                 "user_id": int(user_id),
@@ -332,14 +858,14 @@ class Database:
         )
         return payment_id
 
-    def get_payment(self, payment_id: int) -> Optional[tuple]:
-        doc = self.db.payment_transactions.find_one({"id": int(payment_id)})
+    async def get_payment(self, payment_id: int) -> Optional[tuple]:
+        doc = await self.db.payment_transactions.find_one({"id": int(payment_id)})
         return self._payment_tuple(doc)
 
-    def update_payment_status(self, payment_id: int, status: str):
-        self.db.payment_transactions.update_one({"id": int(payment_id)}, {"$set": {"status": status}})
+    async def update_payment_status(self, payment_id: int, status: str):
+        await self.db.payment_transactions.update_one({"id": int(payment_id)}, {"$set": {"status": status}})
 
-    def add_channel(
+    async def add_channel(
         self,
         channel_id: str,
         channel_name: str,
@@ -348,7 +874,7 @@ class Database:
         invite_link: Optional[str] = None,
     ):
         doc = {
-            "id": self._next_id("channels"),
+            "id": await self._next_id("channels"),
             "channel_id": str(channel_id),
             "channel_name": channel_name,
             "channel_username": channel_username,
@@ -358,48 +884,76 @@ class Database:
             "invite_link": invite_link,
         }
         try:
-            self.db.channels.insert_one(doc)
-            return True
+            await self.db.channels.insert_one(doc)
         except DuplicateKeyError:
             return False
+        await self._bump_stats(total_channels=1)
+        await self.channel_snapshot.reload()
+        return True
 
-    def get_all_channels(self, active_only: bool = True) -> List[tuple]:
-        query = {"is_active": 1} if active_only else {}
-        docs = list(self.db.channels.find(query).sort("id", ASCENDING))
+    async def get_all_channels(self, active_only: bool = True) -> List[tuple]:
+        if active_only:
+            docs = await self.channel_snapshot.get()
+        else:
+            docs = await self.db.channels.find({}).sort("id", ASCENDING).to_list()
         return [self._channel_tuple(doc) for doc in docs]
 
-    def get_channels_by_type(self, channel_type: str, active_only: bool = True) -> List[tuple]:
-        query = {"channel_type": channel_type}
+    async def get_channels_by_type(self, channel_type: str, active_only: bool = True) -> List[tuple]:
         if active_only:
-            query["is_active"] = 1
-        docs = list(self.db.channels.find(query).sort("id", ASCENDING))
+            docs = [doc for doc in await self.channel_snapshot.get() if doc.get("channel_type") == channel_type]
+        else:
+            docs = await self.db.channels.find({"channel_type": channel_type}).sort("id", ASCENDING).to_list()
         return [self._channel_tuple(doc) for doc in docs]
 
-    def delete_channel(self, channel_id: str):
-        self.db.channels.delete_one({"channel_id": str(channel_id)})
+    async def delete_channel(self, channel_id: str):
+        doc = await self.db.channels.find_one_and_delete(
+            {"channel_id": str(channel_id)},
+            projection={"_id": 0, "is_active": 1},
+        )
+        if doc is not None and doc.get("is_active") == 1:
+            await self._bump_stats(total_channels=-1)
+        await self.channel_snapshot.reload()
 
-    def get_daily_channels(self, user_id: int) -> List[tuple]:
+    async def get_daily_channels(self, user_id: int) -> List[tuple]:
         today = datetime.now().date().isoformat()
-        channels = self.get_user_today_channels(user_id, today)
-        active_count = self.db.channels.count_documents({"is_active": 1})
+        channels = await self.get_user_today_channels(user_id, today)
+        active_count = len(await self.channel_snapshot.get())
         target_count = min(6, active_count)
         if channels and len(channels) >= target_count:
+            await self._mark_gate_served(user_id, today)
             return channels
-        return self.rotate_channels(user_id, today)
+        return await self.rotate_channels(user_id, today)
 
-    def _pick_daily_channels(self, user_id: int, limit: int = 6) -> List[dict]:
-        active_channels = list(self.db.channels.find({"is_active": 1}))
+    def _gate_already_marked(self, user_id: int, today: str) -> bool:
+        if self._gate_day != today:
+            self._gate_day = today
+            self._gate_seen = set()
+        if int(user_id) in self._gate_seen:
+            return True
+        self._gate_seen.add(int(user_id))
+        return False
+
+    async def _mark_gate_served(self, user_id: int, today: str):
+        """Record today's gate pass; precompute_rotations selects on ``last_gate_day``."""
+        if not self._gate_already_marked(user_id, today):
+            await self.db.users.update_one({"user_id": int(user_id)}, {"$max": {"last_gate_day": today}})
+
+    async def _pick_daily_channels(self, user_id: int, limit: int = 6) -> List[dict]:
+        active_channels = await self.channel_snapshot.get()
         if not active_channels:
             return []
 
-        limit = max(1, min(int(limit), len(active_channels)))
         cutoff = (datetime.now().date() - timedelta(days=7)).isoformat()
-        recent_subs = self.db.user_subscriptions.find(
+        recent_subs = await self.db.user_subscriptions.find(
             {"user_id": int(user_id), "rotation_day": {"$gte": cutoff}},
             {"channel_id": 1},
-        )
+        ).to_list()
         used_ids = {str(s.get("channel_id")) for s in recent_subs if s.get("channel_id") is not None}
+        return self._select_channels(active_channels, used_ids, limit)
 
+    @staticmethod
+    def _select_channels(active_channels: List[dict], used_ids: set, limit: int = 6) -> List[dict]:
+        limit = max(1, min(int(limit), len(active_channels)))
         z_candidates = [
             ch
             for ch in active_channels
@@ -435,40 +989,134 @@ class Database:
 
         return selected
 
-    def rotate_channels(self, user_id: int, today: str) -> List[tuple]:
-        selected = self._pick_daily_channels(user_id=user_id, limit=6)
-        now_iso = datetime.now().isoformat()
+    @classmethod
+    def _subscription_expiry(cls, day: str) -> datetime:
+        return datetime.fromisoformat(day) + timedelta(days=cls.SUBSCRIPTION_RETENTION_DAYS)
 
-        self.db.user_subscriptions.delete_many({"user_id": int(user_id), "rotation_day": today})
+    @classmethod
+    def _rotation_ops(cls, user_id: int, day: str, selected: List[dict], now_iso: str) -> list:
+        expires_at = cls._subscription_expiry(day)
+        ops = []
         for ch in selected:
             channel_id = str(ch.get("channel_id"))
-            self.db.user_subscriptions.update_one(
-                {"user_id": int(user_id), "channel_id": channel_id, "rotation_day": today},
-                {
-                    "$set": {"rotation_date": now_iso},
-                    "$setOnInsert": {
-                        "user_id": int(user_id),
-                        "channel_id": channel_id,
-                        "rotation_day": today,
-                        "subscribed_date": None,
+            ops.append(
+                UpdateOne(
+                    {"user_id": int(user_id), "channel_id": channel_id, "rotation_day": day},
+                    {
+                        "$set": {"rotation_date": now_iso, "expires_at": expires_at},
+                        "$setOnInsert": {
+                            "user_id": int(user_id),
+                            "channel_id": channel_id,
+                            "rotation_day": day,
+                            "subscribed_date": None,
+                        },
                     },
-                },
-                upsert=True,
+                    upsert=True,
+                )
             )
+        return ops
 
-        self.db.users.update_one(
-            {"user_id": int(user_id)},
-            {"$set": {"last_rotation_date": now_iso}},
+    async def rotate_channels(self, user_id: int, today: str) -> List[tuple]:
+        selected = await self._pick_daily_channels(user_id=user_id, limit=6)
+        now_iso = datetime.now().isoformat()
+
+        ops = [DeleteMany({"user_id": int(user_id), "rotation_day": today})]
+        ops.extend(self._rotation_ops(user_id, today, selected, now_iso))
+        self._gate_already_marked(user_id, today)
+        await asyncio.gather(
+            self.db.user_subscriptions.bulk_write(ops, ordered=True),
+            self.db.users.update_one(
+                {"user_id": int(user_id)},
+                {"$set": {"last_rotation_date": now_iso}, "$max": {"last_gate_day": today}},
+            ),
         )
         return [self._channel_tuple(doc) for doc in selected]
 
-    def get_user_today_channels(self, user_id: int, today: str) -> List[tuple]:
-        sub_docs = list(
-            self.db.user_subscriptions.find(
-                {"user_id": int(user_id)},
-                {"channel_id": 1, "rotation_day": 1, "rotation_date": 1},
-            )
+    async def precompute_rotations(
+        self,
+        day: Optional[str] = None,
+        active_days: int = 1,
+        batch_size: int = 500,
+        batch_delay: float = 0.5,
+    ) -> int:
+        """Assign ``day``'s rotation in batches for users seen at the gate recently; return the count."""
+        day = day or (datetime.now().date() + timedelta(days=1)).isoformat()
+        active_channels = await self.channel_snapshot.get()
+        if not active_channels:
+            return 0
+
+        since = (datetime.now() - timedelta(days=active_days)).isoformat()
+        cursor = self.db.users.find(
+            {
+                "$or": [
+                    {"last_gate_day": {"$gte": since[:10]}},
+                    # Users not seen at the gate since last_gate_day was introduced.
+                    {"last_rotation_date": {"$gte": since}},
+                ]
+            },
+            {"_id": 0, "user_id": 1},
         )
+        rotated = 0
+        batch: List[int] = []
+        async for doc in cursor:
+            if doc.get("user_id") is None:
+                continue
+            batch.append(int(doc["user_id"]))
+            if len(batch) >= batch_size:
+                rotated += await self._precompute_rotation_batch(batch, day, active_channels)
+                batch = []
+                await asyncio.sleep(batch_delay)
+        if batch:
+            rotated += await self._precompute_rotation_batch(batch, day, active_channels)
+        logger.info("Precomputed %s channel rotations for %s", rotated, day)
+        return rotated
+
+    async def _precompute_rotation_batch(self, user_ids: List[int], day: str, active_channels: List[dict]) -> int:
+        cutoff = (datetime.fromisoformat(day).date() - timedelta(days=7)).isoformat()
+        subs = await self.db.user_subscriptions.find(
+            {"user_id": {"$in": user_ids}, "rotation_day": {"$gte": cutoff}},
+            {"_id": 0, "user_id": 1, "channel_id": 1, "rotation_day": 1},
+        ).to_list()
+        used: Dict[int, set] = {}
+        already_rotated = set()
+        for sub in subs:
+            uid = int(sub["user_id"])
+            if sub.get("rotation_day") == day:
+                already_rotated.add(uid)
+            if sub.get("channel_id") is not None:
+                used.setdefault(uid, set()).add(str(sub["channel_id"]))
+
+        now_iso = datetime.now().isoformat()
+        ops = []
+        rotated = 0
+        for uid in user_ids:
+            if uid in already_rotated:
+                continue
+            selected = self._select_channels(active_channels, used.get(uid, set()), 6)
+            ops.extend(self._rotation_ops(uid, day, selected, now_iso))
+            rotated += 1
+        if ops:
+            await self.db.user_subscriptions.bulk_write(ops, ordered=False)
+        return rotated
+
+    async def _rotation_precompute_loop(self, hour: int):
+        while True:
+            now = datetime.now()
+            run_at = now.replace(hour=hour % 24, minute=0, second=0, microsecond=0)
+            if run_at <= now:
+                run_at += timedelta(days=1)
+            await asyncio.sleep((run_at - now).total_seconds())
+            try:
+                await self.precompute_rotations()
+            except Exception:
+                logger.exception("Channel rotation precompute failed")
+
+    async def get_user_today_channels(self, user_id: int, today: str) -> List[tuple]:
+        # rotation_day None also matches legacy rows that only carry rotation_date.
+        sub_docs = await self.db.user_subscriptions.find(
+            {"user_id": int(user_id), "rotation_day": {"$in": [today, None]}},
+            {"channel_id": 1, "rotation_day": 1, "rotation_date": 1},
+        ).to_list()
         channel_ids = []
         for sub in sub_docs:
             day = sub.get("rotation_day") or self._extract_day(sub.get("rotation_date"))
@@ -478,18 +1126,21 @@ class Database:
         if not channel_ids:
             return []
 
-        channel_docs = list(self.db.channels.find({"channel_id": {"$in": channel_ids}, "is_active": 1}))
-        channel_map = {str(doc.get("channel_id")): doc for doc in channel_docs}
+        channel_map = await self.channel_snapshot.get_map()
         ordered = [channel_map[cid] for cid in channel_ids if cid in channel_map]
         return [self._channel_tuple(doc) for doc in ordered]
 
-    def mark_subscription(self, user_id: int, channel_id: str):
+    async def mark_subscription(self, user_id: int, channel_id: str):
         now_iso = datetime.now().isoformat()
         day = self._extract_day(now_iso)
-        self.db.user_subscriptions.update_one(
+        await self.db.user_subscriptions.update_one(
             {"user_id": int(user_id), "channel_id": str(channel_id), "rotation_day": day},
             {
-                "$set": {"subscribed_date": now_iso, "rotation_date": now_iso},
+                "$set": {
+                    "subscribed_date": now_iso,
+                    "rotation_date": now_iso,
+                    "expires_at": self._subscription_expiry(day),
+                },
                 "$setOnInsert": {
                     "user_id": int(user_id),
                     "channel_id": str(channel_id),
@@ -499,7 +1150,22 @@ class Database:
             upsert=True,
         )
 
-    def add_movie(
+    async def purge_old_subscriptions(self) -> int:
+        """Delete rotations older than the retention window that lack ``expires_at``."""
+        cutoff = (datetime.now().date() - timedelta(days=self.SUBSCRIPTION_RETENTION_DAYS)).isoformat()
+        result = await self.db.user_subscriptions.delete_many(
+            {
+                "$or": [
+                    {"rotation_day": {"$lt": cutoff}},
+                    {"rotation_day": None, "rotation_date": {"$lt": cutoff}},
+                ]
+            }
+        )
+        if result.deleted_count:
+            logger.info("Purged %s old user_subscriptions rows", result.deleted_count)
+        return result.deleted_count
+
+    async def add_movie(
         self,
         title: str,
         code: str,
@@ -513,10 +1179,11 @@ class Database:
         source_chat_id: Optional[str] = None,
         source_message_id: Optional[int] = None,
     ) -> Optional[int]:
-        movie_id = self._next_id("movies")
+        movie_id = await self._next_id("movies")
         doc = {
             "id": movie_id,
             "title": title,
+            "title_norm": normalize_title(title),
             "code": code,
             "file_id": file_id,
             "file_type": file_type,
@@ -532,110 +1199,290 @@ class Database:
             "source_message_id": self._normalize_int(source_message_id),
         }
         try:
-            self.db.movies.insert_one(doc)
-            return movie_id
+            await self.db.movies.insert_one(doc)
         except DuplicateKeyError:
             return None
+        self.movie_cache.put(doc)
+        self._apply_catalog_change("add", doc)
+        await self._bump_catalog_version()
+        await self._bump_stats(total_movies=1, total_series=1 if media_type == "series" else 0)
+        return movie_id
 
-    def get_movie_by_code(self, code: str, active_only: bool = True) -> Optional[tuple]:
+    async def get_movie_by_code(self, code: str, active_only: bool = True) -> Optional[tuple]:
         normalized = (code or "").strip().upper()
         if not normalized:
             return None
-        query = {"code": normalized}
-        if active_only:
-            query["is_active"] = 1
-        doc = self.db.movies.find_one(query)
+        doc = await self._get_movie_doc_by_code(normalized)
+        if doc and active_only and doc.get("is_active") != 1:
+            return None
         return self._movie_tuple(doc)
 
-    def deactivate_movie_by_code(self, code: str) -> Optional[tuple]:
+    async def deactivate_movie_by_code(self, code: str) -> Optional[tuple]:
         normalized = (code or "").strip().upper()
         if not normalized:
             return None
-        doc = self.db.movies.find_one_and_update(
+        doc = await self.db.movies.find_one_and_update(
             {"code": normalized, "is_active": 1},
             {"$set": {"is_active": 0}},
             return_document=ReturnDocument.BEFORE,
         )
+        if doc:
+            self.movie_cache.invalidate(movie_id=doc.get("id"), code=doc.get("code"))
+            self._apply_catalog_change("remove", doc.get("id"))
+            await self._bump_catalog_version()
+            await self._bump_stats(total_movies=-1, total_series=-1 if doc.get("media_type") == "series" else 0)
         return self._movie_tuple(doc)
 
-    def delete_series_episodes(self, movie_id: int) -> int:
-        result = self.db.series_episodes.delete_many({"movie_id": int(movie_id)})
+    async def delete_series_episodes(self, movie_id: int) -> int:
+        result = await self.db.series_episodes.delete_many({"movie_id": int(movie_id)})
+        self.episode_cache.invalidate(movie_id)
         return int(result.deleted_count)
 
-    def search_movie(self, query: str) -> Optional[tuple]:
-        doc = self.db.movies.find_one({"code": query, "is_active": 1})
+    async def search_movie(self, query: str) -> Optional[tuple]:
+        doc = await self.db.movies.find_one({"code": query, "is_active": 1})
         if not doc:
-            doc = self.db.movies.find_one(
+            doc = await self.db.movies.find_one(
                 {"title": {"$regex": re.escape(query), "$options": "i"}, "is_active": 1}
             )
         return self._movie_tuple(doc)
 
-    def search_movies(self, query: str, limit: int = 6) -> List[tuple]:
-        q = query.strip()
-        if not q:
+    @staticmethod
+    def _replay_catalog_change(index, action: str, payload):
+        if action == "add":
+            index.add(payload)
+        elif payload is not None:
+            index.remove(payload)
+
+    def _apply_catalog_change(self, action: str, payload):
+        self._replay_catalog_change(self.title_index, action, payload)
+        self._replay_catalog_change(self.title_matcher, action, payload)
+        self._replay_catalog_change(self.title_trie, action, payload)
+        self._replay_catalog_change(self.category_sampler, action, payload)
+        if self._catalog_changes is not None:
+            self._catalog_changes.append((action, payload))
+
+    def _build_catalog_indexes(self, docs: List[dict]) -> tuple:
+        index = TitleIndex()
+        index.load(docs)
+        matcher = TrigramMatcher()
+        matcher.load(docs)
+        trie = PrefixTrie(top_k=self.title_trie.top_k, max_depth=self.title_trie.max_depth)
+        trie.load(docs)
+        sampler = CategorySampler()
+        sampler.load(docs)
+        return index, matcher, trie, sampler
+
+    async def rebuild_title_index(self, force: bool = False):
+        """Rebuild the catalog indexes if stale, heavily patched or not rebuilt for a while."""
+        async with self._title_index_lock:
+            version = await self._read_catalog_version()
+            self._title_index_skips += 1
+            if (
+                not force
+                and self.title_index.ready
+                and version == self._title_index_version
+                and self._title_index_skips < self.TITLE_INDEX_MAX_SKIPS
+                and self.title_matcher.churn < max(1000, len(self.title_matcher) // 10)
+            ):
+                return
+            self._title_index_skips = 0
+            self._catalog_changes = []
+            try:
+                docs = await self.db.movies.find(
+                    {"is_active": 1},
+                    {
+                        "_id": 0,
+                        "id": 1,
+                        "title": 1,
+                        "title_norm": 1,
+                        "code": 1,
+                        "media_type": 1,
+                        "category": 1,
+                        "views": 1,
+                        "is_active": 1,
+                    },
+                ).to_list()
+                # The O(catalog) builds run in a worker thread to keep the event loop free.
+                indexes = await asyncio.to_thread(self._build_catalog_indexes, docs)
+                for action, payload in self._catalog_changes:
+                    for index in indexes:
+                        self._replay_catalog_change(index, action, payload)
+                self.title_index, self.title_matcher, self.title_trie, self.category_sampler = indexes
+                self._title_index_version = version
+                # Cached answers (hits and misses) came from the old indexes.
+                self.search_cache.clear()
+            finally:
+                self._catalog_changes = None
+
+    async def autocomplete(self, query: str, limit: int = 20) -> List[Tuple[int, str, str, str]]:
+        """Return ``(id, title, code, media_type)`` for titles or codes starting with ``query``."""
+        if self.title_trie.ready:
+            trie = self.title_trie
+            return [(movie_id, *trie.entry(movie_id)) for movie_id in trie.complete(query, limit)]
+        if not normalize_query(query):
             return []
+        results, _ = await self.search_catalog(query, limit=limit)
+        return [(movie[0], movie[1], movie[2], movie[5]) for movie in results]
+
+    async def _hydrate_movies(self, movie_ids: List[int]) -> List[tuple]:
+        movie_map = await self._get_active_movie_docs(movie_ids)
+        return [self._movie_tuple(movie_map[movie_id]) for movie_id in movie_ids if movie_id in movie_map]
+
+    async def _hydrate_live(self, movie_ids: List[int]) -> List[tuple]:
+        """Hydrate ``movie_ids``, removing the ones that are no longer active from the local indexes."""
+        results = await self._hydrate_movies(movie_ids)
+        found = {movie[0] for movie in results}
+        for movie_id in movie_ids:
+            if movie_id not in found:
+                self._apply_catalog_change("remove", movie_id)
+        return results
 
-        doc = self.db.movies.find_one({"code": q.upper(), "is_active": 1})
-        if doc:
-            return [self._movie_tuple(doc)]
-
-        exact_docs = list(
-            self.db.movies.find(
-                {"title": {"$regex": f"^{re.escape(q)}$", "$options": "i"}, "is_active": 1}
-            ).limit(limit)
-        )
-        if exact_docs:
-            return [self._movie_tuple(doc) for doc in exact_docs]
-
-        docs = list(
-            self.db.movies.find(
-                {"title": {"$regex": re.escape(q), "$options": "i"}, "is_active": 1}
-            )
-            .sort("views", DESCENDING)
-            .limit(limit)
+    async def _bump_catalog_version(self):
+        """Advance the shared catalog version, dropping cached search results everywhere."""
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": "catalog_version"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
-        return [self._movie_tuple(doc) for doc in docs]
-
-    def search_movies_fuzzy(self, query: str, limit: int = 6, min_score: float = 0.45) -> List[tuple]:
-        q = query.strip().lower()
+        version = int(counter.get("seq", 0))
+        self.search_cache.set_version(version)
+        # Our own change is already in the live indexes; only someone else's
+        # change in between would make them stale.
+        if self._title_index_version == version - 1:
+            self._title_index_version = version
+
+    async def _read_catalog_version(self) -> int:
+        counter = await self.db.counters.find_one({"_id": "catalog_version"})
+        return int(counter.get("seq", 0)) if counter else 0
+
+    async def sync_catalog_version(self):
+        """Pick up catalog version bumps made by other bot processes and rebuild for them."""
+        version = await self._read_catalog_version()
+        self.search_cache.set_version(version)
+        if self.title_index.ready and version != self._title_index_version:
+            await self.rebuild_title_index()
+
+    async def search_catalog(self, query: str, limit: int = 6, min_score: float = 0.45) -> Tuple[List[tuple], bool]:
+        """Return ``(results, is_fuzzy)`` from the best non-empty search stage."""
+        q = normalize_query(query)
         if not q:
-            return []
-        tokens = re.findall(r"[a-z0-9]+", q)
-        if not tokens:
-            return []
-
-        def norm_text(text: str) -> str:
-            text = text.lower()
-            text = re.sub(r"[^a-z0-9]+", "", text)
-            text = re.sub(r"(.)\1{2,}", r"\1\1", text)
-            return text
-
-        q_norm = norm_text(q)
-        if not q_norm:
-            return []
-
-        token_filters = [{"title": {"$regex": re.escape(t), "$options": "i"}} for t in tokens]
-        candidates = list(
-            self.db.movies.find({"is_active": 1, "$or": token_filters}).limit(max(limit * 10, 10))
+            return [], False
+
+        key = (q, int(limit), float(min_score))
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            movie_ids, is_fuzzy = cached
+            return await self._hydrate_movies(list(movie_ids)), is_fuzzy
+
+        version = self.search_cache.version
+        index = self.title_index
+        results, is_fuzzy = await self._search_catalog_uncached(q, limit, min_score)
+        if self.title_index is index:
+            self.search_cache.put(key, [movie[0] for movie in results], is_fuzzy, version)
+        return results, is_fuzzy
+
+    async def _search_catalog_uncached(self, q: str, limit: int, min_score: float) -> Tuple[List[tuple], bool]:
+        if self.title_index.ready and self.title_matcher.ready:
+            # Ids that no longer hydrate were deactivated elsewhere; drop them
+            # from the local indexes and let the next stage answer.
+            while True:
+                movie_id = self.title_index.find_code(q)
+                ids = [movie_id] if movie_id is not None else self.title_index.search(q, limit)
+                if not ids:
+                    break
+                results = await self._hydrate_live(ids)
+                if results:
+                    return results, False
+            while True:
+                ids = self.title_matcher.search(q, limit, min_score)
+                results = await self._hydrate_live(ids)
+                if results or not ids:
+                    return results, True
+
+        doc = await self._get_movie_doc_by_code(q.upper())
+        if doc and doc.get("is_active") == 1:
+            return [self._movie_tuple(doc)], False
+
+        # Unanchored, case-insensitive title regexes cannot use an index, so
+        # both share one collection scan; the anchored title_norm prefix can,
+        # and runs alongside it.
+        q_norm = normalize_title(q)
+        title_stages, norm_docs = await asyncio.gather(
+            self._title_regex_stages(q, limit),
+            self._find_by_norm_prefix(q_norm, limit, sort_by_views=True),
         )
+        for docs in (*title_stages, norm_docs):
+            if docs:
+                for doc in docs:
+                    self.movie_cache.put(doc)
+                return [self._movie_tuple(doc) for doc in docs], False
 
+        if not q_norm:
+            return [], True
+        candidates = await self._find_by_norm_prefix(q_norm[:3], max(limit * 10, 10))
         if not candidates:
-            candidates = list(self.db.movies.find({"is_active": 1}).sort("views", DESCENDING).limit(200))
-
+            candidates = await self.db.movies.find({"is_active": 1}).sort("views", DESCENDING).limit(200).to_list()
         scored = []
         for movie in candidates:
-            title_norm = norm_text(movie.get("title") or "")
+            title_norm = movie.get("title_norm") or normalize_title(movie.get("title"))
             if not title_norm:
                 continue
             score = difflib.SequenceMatcher(None, q_norm, title_norm).ratio()
             if score >= min_score:
                 scored.append((score, movie))
-
         scored.sort(key=lambda item: item[0], reverse=True)
-        return [self._movie_tuple(doc) for _, doc in scored[:limit]]
+        return [self._movie_tuple(doc) for _, doc in scored[:limit]], True
 
-    def get_movie_by_source(self, source_chat_id: str, source_message_id: int) -> Optional[tuple]:
-        doc = self.db.movies.find_one(
+    async def _title_regex_stages(self, q: str, limit: int) -> Tuple[List[dict], List[dict]]:
+        """Return ``(exact, substring)`` title matches from a single ``$facet`` pass."""
+        cursor = await self.db.movies.aggregate(
+            [
+                {"$match": {"is_active": 1, "title": {"$regex": re.escape(q), "$options": "i"}}},
+                {
+                    "$facet": {
+                        "exact": [
+                            {"$match": {"title": {"$regex": f"^{re.escape(q)}$", "$options": "i"}}},
+                            {"$limit": int(limit)},
+                        ],
+                        "substring": [{"$sort": {"views": -1}}, {"$limit": int(limit)}],
+                    }
+                },
+            ]
+        )
+        rows = await cursor.to_list()
+        facets = rows[0] if rows else {}
+        return facets.get("exact") or [], facets.get("substring") or []
+
+    async def _find_by_norm_prefix(self, prefix: str, limit: int, sort_by_views: bool = False) -> List[dict]:
+        if not prefix:
+            return []
+        cursor = self.db.movies.find({"title_norm": {"$regex": f"^{re.escape(prefix)}"}, "is_active": 1})
+        if sort_by_views:
+            cursor = cursor.sort("views", DESCENDING)
+        return await cursor.limit(int(limit)).to_list()
+
+    async def backfill_title_norms(self, batch_size: int = 500) -> int:
+        """Store ``title_norm`` on movies written before the field existed."""
+        cursor = self.db.movies.find({"title_norm": {"$exists": False}}, {"_id": 1, "title": 1})
+        updated = 0
+        batch = []
+        async for doc in cursor:
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"title_norm": normalize_title(doc.get("title"))}}))
+            if len(batch) >= batch_size:
+                await self.db.movies.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            await self.db.movies.bulk_write(batch, ordered=False)
+            updated += len(batch)
+        if updated:
+            self.movie_cache.clear()
+            logger.info("Backfilled title_norm for %s movies", updated)
+        return updated
+
+    async def get_movie_by_source(self, source_chat_id: str, source_message_id: int) -> Optional[tuple]:
+        doc = await self.db.movies.find_one(
             {
                 "source_chat_id": self._normalize_chat_id(source_chat_id),
                 "source_message_id": self._normalize_int(source_message_id),
@@ -643,8 +1490,8 @@ class Database:
         )
         return self._movie_tuple(doc)
 
-    def get_episode_by_source(self, source_chat_id: str, source_message_id: int) -> Optional[tuple]:
-        doc = self.db.series_episodes.find_one(
+    async def get_episode_by_source(self, source_chat_id: str, source_message_id: int) -> Optional[tuple]:
+        doc = await self.db.series_episodes.find_one(
             {
                 "source_chat_id": self._normalize_chat_id(source_chat_id),
                 "source_message_id": self._normalize_int(source_message_id),
@@ -652,11 +1499,11 @@ class Database:
         )
         return self._episode_tuple(doc)
 
-    def is_code_exists(self, code: str) -> bool:
-        return self.db.movies.find_one({"code": code}, {"_id": 1}) is not None
+    async def is_code_exists(self, code: str) -> bool:
+        return await self._get_movie_doc_by_code(code) is not None
 
-    def find_series_by_title(self, title: str) -> Optional[tuple]:
-        doc = self.db.movies.find_one(
+    async def find_series_by_title(self, title: str) -> Optional[tuple]:
+        doc = await self.db.movies.find_one(
             {
                 "title": {"$regex": f"^{re.escape(title.strip())}$", "$options": "i"},
                 "media_type": "series",
@@ -665,39 +1512,88 @@ class Database:
         )
         return self._movie_tuple(doc)
 
-    def is_channel_registered(self, channel_id: str) -> bool:
-        return self.db.channels.find_one({"channel_id": str(channel_id), "is_active": 1}, {"_id": 1}) is not None
-
-    def increment_movie_views(self, movie_id: int):
-        self.db.movies.update_one({"id": int(movie_id), "is_active": 1}, {"$inc": {"views": 1}})
-
-    def get_similar_movies(self, movie_id: int, category: str, limit: int = 5) -> List[tuple]:
-        docs = list(
-            self.db.movies.find({"category": category, "id": {"$ne": int(movie_id)}, "is_active": 1})
+    async def is_channel_registered(self, channel_id: str) -> bool:
+        return str(channel_id) in await self.channel_snapshot.get_map()
+
+    async def increment_movie_views(self, movie_id: int):
+        self.stats_buffer.add_movie_view(movie_id)
+
+    async def get_similar_movies(self, movie_id: int, category: str, limit: int = 5) -> List[tuple]:
+        """Return up to ``limit`` random active movies from ``category``, excluding ``movie_id``."""
+        if self.category_sampler.ready:
+            return await self._hydrate_movies(self.category_sampler.sample(category, limit, exclude=int(movie_id)))
+        cursor = await self.db.movies.aggregate(
+            [
+                {"$match": {"category": category, "id": {"$ne": int(movie_id)}, "is_active": 1}},
+                {"$sample": {"size": int(limit)}},
+            ]
         )
-        random.shuffle(docs)
-        return [self._movie_tuple(doc) for doc in docs[:limit]]
+        docs = await cursor.to_list()
+        for doc in docs:
+            self.movie_cache.put(doc)
+        return [self._movie_tuple(doc) for doc in docs]
 
-    def get_movies_by_category(self, category: str, limit: int = 20) -> List[tuple]:
-        docs = list(
+    async def get_movies_by_category(self, category: str, limit: int = 20) -> List[tuple]:
+        docs = await (
             self.db.movies.find({"category": category, "is_active": 1})
             .sort("views", DESCENDING)
             .limit(limit)
+            .to_list()
         )
         return [self._movie_tuple(doc) for doc in docs]
 
-    def get_trending_movies(self, days: int = 7, limit: int = 10) -> List[tuple]:
-        since_date = (datetime.now() - timedelta(days=days)).isoformat()
-        grouped = list(
-            self.db.view_statistics.aggregate(
-                [
-                    {"$match": {"view_date": {"$gte": since_date}}},
-                    {"$group": {"_id": "$movie_id", "recent_views": {"$sum": 1}}},
-                    {"$sort": {"recent_views": -1}},
-                    {"$limit": max(limit * 5, 50)},
-                ]
-            )
+    async def _get_active_movie_docs(self, movie_ids: List[int]) -> Dict[int, dict]:
+        """Hydrate active movie documents through the cache with at most one query."""
+        found: Dict[int, dict] = {}
+        missing = []
+        for movie_id in movie_ids:
+            doc = self.movie_cache.get(movie_id)
+            if doc is None:
+                missing.append(int(movie_id))
+            elif doc.get("is_active") == 1:
+                found[int(movie_id)] = doc
+        if missing:
+            for doc in await self.db.movies.find({"id": {"$in": missing}}).to_list():
+                self.movie_cache.put(doc)
+                if doc.get("is_active") == 1 and doc.get("id") is not None:
+                    found[int(doc["id"])] = doc
+        return found
+
+    async def sync_trending(self):
+        """Flush local views, then reload the trending window from ``movie_views_daily``."""
+        await self.stats_buffer.flush()
+        docs = await self.db.movie_views_daily.find(
+            {"day": {"$gte": self.trending.window_start()}},
+            {"_id": 0, "movie_id": 1, "day": 1, "views": 1},
+        ).to_list()
+        self.trending.load(
+            (doc["movie_id"], doc["day"], doc.get("views") or 0) for doc in docs if doc.get("movie_id") is not None
         )
+
+    async def get_trending_movies(self, days: int = 7, limit: int = 10) -> List[tuple]:
+        if self.trending.ready and days == self.trending.days and limit <= self.trending.top_k:
+            ranked = self.trending.top()
+            movie_map = await self._get_active_movie_docs([movie_id for movie_id, _ in ranked])
+            results = []
+            for movie_id, views in ranked:
+                movie_doc = movie_map.get(movie_id)
+                if movie_doc:
+                    results.append(self._movie_tuple(movie_doc) + (views,))
+                    if len(results) >= limit:
+                        break
+            return results
+
+        # Same window as TrendingEngine: today plus the previous days - 1.
+        since_day = (datetime.now() - timedelta(days=max(1, int(days)) - 1)).date().isoformat()
+        cursor = await self.db.movie_views_daily.aggregate(
+            [
+                {"$match": {"day": {"$gte": since_day}}},
+                {"$group": {"_id": "$movie_id", "recent_views": {"$sum": "$views"}}},
+                {"$sort": {"recent_views": -1}},
+                {"$limit": max(limit * 5, 50)},
+            ]
+        )
+        grouped = await cursor.to_list()
         if not grouped:
             return []
 
@@ -705,8 +1601,7 @@ class Database:
         if not movie_ids:
             return []
 
-        docs = list(self.db.movies.find({"id": {"$in": movie_ids}, "is_active": 1}))
-        movie_map = {int(doc["id"]): doc for doc in docs if doc.get("id") is not None}
+        movie_map = await self._get_active_movie_docs(movie_ids)
 
         results = []
         for row in grouped:
@@ -721,7 +1616,37 @@ class Database:
                 break
         return results
 
-    def add_series_episode(
+    async def backfill_view_rollups(self) -> int:
+        """Rebuild ``movie_views_daily`` from ``view_statistics`` on the server via ``$merge``; return the count."""
+        await self.stats_buffer.flush()
+        cursor = await self.db.view_statistics.aggregate(
+            [
+                {"$match": {"movie_id": {"$ne": None}, "view_date": {"$type": "string"}}},
+                {
+                    "$group": {
+                        "_id": {"movie_id": "$movie_id", "day": {"$substrCP": ["$view_date", 0, 10]}},
+                        "views": {"$sum": 1},
+                    }
+                },
+                {"$project": {"_id": 0, "movie_id": "$_id.movie_id", "day": "$_id.day", "views": 1}},
+                {
+                    "$merge": {
+                        "into": "movie_views_daily",
+                        "on": ["movie_id", "day"],
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        await cursor.to_list()
+        total = await self.db.movie_views_daily.count_documents({})
+        logger.info("View rollups backfilled: %s movie/day rows", total)
+        await self.sync_trending()
+        return total
+
+    async def add_series_episode(
         self,
         movie_id: int,
         episode_number: int,
@@ -732,7 +1657,7 @@ class Database:
         source_message_id: Optional[int] = None,
     ) -> bool:
         doc = {
-            "id": self._next_id("series_episodes"),
+            "id": await self._next_id("series_episodes"),
             "movie_id": int(movie_id),
             "episode_number": int(episode_number),
             "episode_title": episode_title,
@@ -743,110 +1668,221 @@ class Database:
             "source_message_id": self._normalize_int(source_message_id),
         }
         try:
-            self.db.series_episodes.insert_one(doc)
-            return True
+            await self.db.series_episodes.insert_one(doc)
         except DuplicateKeyError:
             return False
+        self.episode_cache.invalidate(movie_id)
+        await self._bump_catalog_version()
+        return True
 
-    def get_series_episodes(self, movie_id: int) -> List[tuple]:
-        if not self.db.movies.find_one({"id": int(movie_id), "is_active": 1}, {"_id": 1}):
-            return []
-        docs = list(self.db.series_episodes.find({"movie_id": int(movie_id)}).sort("episode_number", ASCENDING))
-        return [self._episode_tuple(doc) for doc in docs]
-
-    def get_episode(self, movie_id: int, episode_number: int) -> Optional[tuple]:
-        if not self.db.movies.find_one({"id": int(movie_id), "is_active": 1}, {"_id": 1}):
+    async def _get_episode_manifest(self, movie_id: int) -> Optional[EpisodeManifest]:
+        if not await self._get_active_movie_doc(movie_id):
             return None
-        doc = self.db.series_episodes.find_one(
-            {"movie_id": int(movie_id), "episode_number": int(episode_number)}
-        )
-        return self._episode_tuple(doc)
+        manifest = self.episode_cache.get(movie_id)
+        if manifest is None:
+            docs = await self.db.series_episodes.find({"movie_id": int(movie_id)}).to_list()
+            manifest = EpisodeManifest(docs, self.EPISODE_FIELDS, self.EPISODE_DEFAULTS)
+            self.episode_cache.put(movie_id, manifest)
+        return manifest
+
+    async def get_series_episodes(self, movie_id: int) -> List[tuple]:
+        manifest = await self._get_episode_manifest(movie_id)
+        return manifest.episodes() if manifest else []
+
+    async def get_episode_numbers(self, movie_id: int) -> List[int]:
+        manifest = await self._get_episode_manifest(movie_id)
+        return list(manifest.numbers) if manifest else []
+
+    async def get_episode(self, movie_id: int, episode_number: int) -> Optional[tuple]:
+        manifest = await self._get_episode_manifest(movie_id)
+        return manifest.episode(episode_number) if manifest else None
+
+    async def add_search_stat(self, user_id: int, query: str, found: bool):
+        self.stats_buffer.add_search(user_id, query, found)
+        self.search_trends.add(query)
+
+    async def add_view_stat(self, user_id: int, movie_id: int):
+        self.stats_buffer.add_view(user_id, movie_id)
+        self.trending.add(movie_id)
+
+    async def flush_stats(self):
+        await self.stats_buffer.flush()
+
+    STAT_COUNTERS = (
+        "total_users",
+        "premium_users",
+        "total_movies",
+        "total_series",
+        "total_searches",
+        "total_views",
+        "total_channels",
+    )
 
-    def add_search_stat(self, user_id: int, query: str, found: bool):
-        stat_id = self._next_id("search_statistics")
-        self.db.search_statistics.insert_one(
-            {
-                "id": stat_id,
-                "user_id": int(user_id),
-                "query": query,
-                "found": 1 if found else 0,
-                "search_date": datetime.now().isoformat(),
-            }
+    async def _bump_stats(self, **incs: int):
+        incs = {field: int(value) for field, value in incs.items() if value}
+        if incs:
+            await self.db.stats.update_one({"_id": "global"}, {"$inc": incs}, upsert=True)
+
+    async def reconcile_stats(self) -> Dict:
+        """Recompute the materialized counters in the ``stats`` document from scratch."""
+        await self.flush_stats()
+        counts = await asyncio.gather(
+            # Unfiltered totals come from collection metadata instead of a full scan.
+            self.db.users.estimated_document_count(),
+            self.db.users.count_documents({"is_premium": 1}),
+            self.db.movies.count_documents({"is_active": 1}),
+            self.db.movies.count_documents({"media_type": "series", "is_active": 1}),
+            self.db.search_statistics.estimated_document_count(),
+            self.db.view_statistics.estimated_document_count(),
+            self.db.channels.count_documents({"is_active": 1}),
         )
-        self.db.users.update_one({"user_id": int(user_id)}, {"$inc": {"total_searches": 1}})
-
-    def add_view_stat(self, user_id: int, movie_id: int):
-        stat_id = self._next_id("view_statistics")
-        self.db.view_statistics.insert_one(
-            {
-                "id": stat_id,
-                "user_id": int(user_id),
-                "movie_id": int(movie_id),
-                "view_date": datetime.now().isoformat(),
-            }
+        totals = dict(zip(self.STAT_COUNTERS, counts))
+        await self.db.stats.update_one(
+            {"_id": "global"},
+            {"$set": {**totals, "reconciled_at": datetime.now().isoformat()}},
+            upsert=True,
         )
-        self.db.users.update_one({"user_id": int(user_id)}, {"$inc": {"total_views": 1}})
+        return totals
+
+    async def get_statistics(self) -> Dict:
+        doc = await self.db.stats.find_one({"_id": "global"})
+        if doc is None or "reconciled_at" not in doc:
+            doc = await self.reconcile_stats()
+        stats = {field: int(doc.get(field) or 0) for field in self.STAT_COUNTERS}
+        pending_searches, pending_views = self.stats_buffer.pending_counts()
+        stats["total_searches"] += pending_searches
+        stats["total_views"] += pending_views
+
+        stats["today_active"] = self.active_users.count(1)
+        stats["weekly_active"] = self.active_users.count(7)
+        stats["monthly_active"] = self.active_users.count(30)
+        return stats
 
-    def get_statistics(self) -> Dict:
-        stats = {}
-        stats["total_users"] = self.db.users.count_documents({})
-        stats["premium_users"] = self.db.users.count_documents({"is_premium": 1})
-        stats["total_movies"] = self.db.movies.count_documents({"is_active": 1})
-        stats["total_series"] = self.db.movies.count_documents({"media_type": "series", "is_active": 1})
+    def record_activity(self, user_id: int):
+        self.active_users.add(user_id)
 
-        today = datetime.now().date().isoformat()
-        tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
-        active_user_ids = self.db.search_statistics.distinct(
-            "user_id", {"search_date": {"$gte": today, "$lt": tomorrow}}
-        )
-        stats["today_active"] = len(active_user_ids)
-        stats["total_searches"] = self.db.search_statistics.count_documents({})
-        stats["total_views"] = self.db.view_statistics.count_documents({})
-        stats["total_channels"] = self.db.channels.count_documents({"is_active": 1})
-        return stats
+    async def get_top_searches(self, limit: int = 10, days: int = 7) -> List[tuple]:
+        return self.search_trends.top(days, limit)
 
-    def get_top_searches(self, limit: int = 10) -> List[tuple]:
-        since_date = (datetime.now() - timedelta(days=7)).date().isoformat()
-        rows = list(
-            self.db.search_statistics.aggregate(
-                [
-                    {"$match": {"search_date": {"$gte": since_date}}},
-                    {"$group": {"_id": "$query", "search_count": {"$sum": 1}}},
-                    {"$sort": {"search_count": -1}},
-                    {"$limit": int(limit)},
-                ]
-            )
+    async def _load_sketches(self, store, collection, seed: bool = False) -> List[dict]:
+        """Load ``store``'s checkpoints from ``collection``; return the raw documents."""
+        oldest = store.window_days(store.days)[-1]
+        docs = await collection.find({"day": {"$gte": oldest}}, {"_id": 0}).to_list()
+        store.load_documents(docs, self.instance_id, seed)
+        return docs
+
+    async def _checkpoint_sketches(self, store, collection):
+        """Write ``store``'s changed local days under this instance id."""
+        dirty, store.dirty_days = store.dirty_days, set()
+        try:
+            for day in sorted(dirty):
+                sketch = store.local.get(day)
+                if sketch is None:
+                    continue
+                await collection.update_one(
+                    {"day": day, "instance": self.instance_id},
+                    {
+                        "$set": {
+                            **store.to_document(sketch),
+                            "updated_at": datetime.now(),
+                            "expires_at": self._sketch_expiry(day, store.days),
+                        }
+                    },
+                    upsert=True,
+                )
+        except PyMongoError:
+            store.dirty_days |= dirty
+            raise
+
+    async def load_search_sketches(self, seed: bool = False):
+        """Load per-day search sketches; with ``seed``, build them from history on first run."""
+        docs = await self._load_sketches(self.search_trends, self.db.search_sketches, seed)
+        if seed and not docs and await self.db.search_sketches.estimated_document_count() == 0:
+            oldest = self.search_trends.window_days(self.search_trends.days)[-1]
+            self.search_trends.load_documents(await self._backfill_search_sketches(oldest), self.instance_id)
+
+    async def _backfill_search_sketches(self, oldest: str) -> List[dict]:
+        capacity = self.search_trends.capacity
+        cursor = await self.db.search_statistics.aggregate(
+            [
+                {"$match": {"search_date": {"$gte": oldest}, "query": {"$type": "string"}}},
+                {
+                    "$group": {
+                        "_id": {
+                            "day": {"$substrCP": ["$search_date", 0, 10]},
+                            "query": {"$toLower": {"$trim": {"input": "$query"}}},
+                        },
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$sort": {"count": -1}},
+                {"$group": {"_id": "$_id.day", "items": {"$push": {"query": "$_id.query", "count": "$count"}}}},
+                {"$project": {"_id": 0, "day": "$_id", "items": {"$slice": ["$items", capacity]}}},
+            ],
+            allowDiskUse=True,
         )
-        return [(row.get("_id"), int(row.get("search_count", 0))) for row in rows]
+        rows = await cursor.to_list()
+        docs = []
+        for row in rows:
+            doc = {
+                "day": row["day"],
+                "instance": "backfill",
+                "items": SpaceSaving.from_items(
+                    ([item.get("query"), item.get("count", 0)] for item in row.get("items") or []),
+                    capacity,
+                ).to_items(),
+                "updated_at": datetime.now(),
+                "expires_at": self._sketch_expiry(row["day"], self.search_trends.days),
+            }
+            await self.db.search_sketches.update_one(
+                {"day": doc["day"], "instance": doc["instance"]},
+                {"$set": doc},
+                upsert=True,
+            )
+            docs.append(doc)
+        if docs:
+            logger.info("Search sketches seeded from history for %s days", len(docs))
+        return docs
 
-    def get_movie_by_id(self, movie_id: int, active_only: bool = True) -> Optional[tuple]:
-        query = {"id": int(movie_id)}
-        if active_only:
-            query["is_active"] = 1
-        doc = self.db.movies.find_one(query)
+    @staticmethod
+    def _sketch_expiry(day: str, days: int) -> datetime:
+        return datetime.fromisoformat(day) + timedelta(days=days + 1)
+
+    async def checkpoint_search_sketches(self):
+        await self._checkpoint_sketches(self.search_trends, self.db.search_sketches)
+
+    async def load_activity_sketches(self, seed: bool = False):
+        await self._load_sketches(self.active_users, self.db.activity_sketches, seed)
+
+    async def checkpoint_activity_sketches(self):
+        await self._checkpoint_sketches(self.active_users, self.db.activity_sketches)
+
+    async def sync_analytics(self):
+        """Checkpoint this process's sketches and merge in the other instances'."""
+        await self.checkpoint_search_sketches()
+        await self.checkpoint_activity_sketches()
+        await self.load_search_sketches()
+        await self.load_activity_sketches()
+
+    async def get_movie_by_id(self, movie_id: int, active_only: bool = True) -> Optional[tuple]:
+        doc = await self._get_active_movie_doc(movie_id, active_only)
         return self._movie_tuple(doc)
 
-    def get_movie_title(self, movie_id: int, active_only: bool = True) -> Optional[str]:
-        query = {"id": int(movie_id)}
-        if active_only:
-            query["is_active"] = 1
-        doc = self.db.movies.find_one(query, {"title": 1})
+    async def get_movie_title(self, movie_id: int, active_only: bool = True) -> Optional[str]:
+        doc = await self._get_active_movie_doc(movie_id, active_only)
         return doc.get("title") if doc else None
 
-    def get_movie_title_and_code(self, movie_id: int, active_only: bool = True) -> Optional[Tuple[str, str]]:
-        query = {"id": int(movie_id)}
-        if active_only:
-            query["is_active"] = 1
-        doc = self.db.movies.find_one(query, {"title": 1, "code": 1})
+    async def get_movie_title_and_code(self, movie_id: int, active_only: bool = True) -> Optional[Tuple[str, str]]:
+        doc = await self._get_active_movie_doc(movie_id, active_only)
         if not doc:
             return None
         return doc.get("title"), doc.get("code")
 
-    def get_all_user_ids(self) -> List[int]:
-        docs = self.db.users.find({}, {"user_id": 1}).sort("user_id", ASCENDING)
+    async def get_all_user_ids(self) -> List[int]:
+        docs = await self.db.users.find({}, {"user_id": 1}).sort("user_id", ASCENDING).to_list()
         return [int(doc["user_id"]) for doc in docs if doc.get("user_id") is not None]
 
-    def migrate_from_sqlite(self, sqlite_path: str) -> bool:
+    async def migrate_from_sqlite(self, sqlite_path: str) -> bool:
         if not sqlite_path or not os.path.exists(sqlite_path):
             logger.warning("SQLite file not found for migration: %s", sqlite_path)
             return False
@@ -854,9 +1890,9 @@ class Database:
         force = os.getenv("MIGRATE_SQLITE_FORCE", "0") == "1"
         if not force:
             has_existing = (
-                self.db.users.count_documents({}) > 0
-                or self.db.channels.count_documents({}) > 0
-                or self.db.movies.count_documents({}) > 0
+                await self.db.users.count_documents({}) > 0
+                or await self.db.channels.count_documents({}) > 0
+                or await self.db.movies.count_documents({}) > 0
             )
             if has_existing:
                 logger.info("MongoDB already has data, sqlite migration skipped")
@@ -899,7 +1935,7 @@ class Database:
                         "total_searches": int(row[8] or 0),
                         "total_views": int(row[9] or 0),
                     }
-                    self.db.users.update_one({"user_id": doc["user_id"]}, {"$set": doc}, upsert=True)
+                    await self.db.users.update_one({"user_id": doc["user_id"]}, {"$set": doc}, upsert=True)
                     migrated["users"] += 1
 
             if "channels" in table_names:
@@ -916,7 +1952,7 @@ class Database:
                         "added_date": row[6],
                         "invite_link": row[7] if len(row) > 7 else None,
                     }
-                    self.db.channels.update_one({"channel_id": doc["channel_id"]}, {"$set": doc}, upsert=True)
+                    await self.db.channels.update_one({"channel_id": doc["channel_id"]}, {"$set": doc}, upsert=True)
                     migrated["channels"] += 1
 
             if "user_subscriptions" in table_names:
@@ -931,7 +1967,7 @@ class Database:
                         "rotation_date": row[4],
                         "rotation_day": day,
                     }
-                    self.db.user_subscriptions.update_one(
+                    await self.db.user_subscriptions.update_one(
                         {"user_id": doc["user_id"], "channel_id": doc["channel_id"], "rotation_day": day},
                         {"$set": doc},
                         upsert=True,
@@ -945,6 +1981,7 @@ class Database:
                     doc = {
                         "id": int(row[0]),
                         "title": row[1],
+                        "title_norm": normalize_title(row[1]),
                         "code": row[2],
                         "file_id": row[3],
                         "file_type": row[4],
@@ -959,7 +1996,7 @@ class Database:
                         "source_chat_id": self._normalize_chat_id(row[13]) if len(row) > 13 else None,
                         "source_message_id": self._normalize_int(row[14]) if len(row) > 14 else None,
                     }
-                    self.db.movies.update_one({"code": doc["code"]}, {"$set": doc}, upsert=True)
+                    await self.db.movies.update_one({"code": doc["code"]}, {"$set": doc}, upsert=True)
                     migrated["movies"] += 1
 
             if "series_episodes" in table_names:
@@ -977,7 +2014,7 @@ class Database:
                         "source_chat_id": self._normalize_chat_id(row[7]) if len(row) > 7 else None,
                         "source_message_id": self._normalize_int(row[8]) if len(row) > 8 else None,
                     }
-                    self.db.series_episodes.update_one(
+                    await self.db.series_episodes.update_one(
                         {"movie_id": doc["movie_id"], "episode_number": doc["episode_number"]},
                         {"$set": doc},
                         upsert=True,
@@ -995,7 +2032,7 @@ class Database:
                         "found": int(row[3] or 0),
                         "search_date": row[4],
                     }
-                    self.db.search_statistics.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
+                    await self.db.search_statistics.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
                     migrated["search_statistics"] += 1
 
             if "view_statistics" in table_names:
@@ -1008,7 +2045,7 @@ class Database:
                         "movie_id": int(row[2]),
                         "view_date": row[3],
                     }
-                    self.db.view_statistics.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
+                    await self.db.view_statistics.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
                     migrated["view_statistics"] += 1
 
             if "payment_transactions" in table_names:
@@ -1023,14 +2060,14 @@ class Database:
                         "status": row[4],
                         "transaction_date": row[5],
                     }
-                    self.db.payment_transactions.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
+                    await self.db.payment_transactions.update_one({"id": doc["id"]}, {"$set": doc}, upsert=True)
                     migrated["payment_transactions"] += 1
 
             if "settings" in table_names:
                 for row in cur.execute("SELECT * FROM settings").fetchall():
                     if len(row) < 2:
                         continue
-                    self.db.settings.update_one(
+                    await self.db.settings.update_one(
                         {"key": row[0]},
                         {"$set": {"value": row[1]}},
                         upsert=True,
@@ -1045,10 +2082,20 @@ class Database:
                 ("search_statistics", "search_statistics"),
                 ("view_statistics", "view_statistics"),
             ]:
-                max_doc = self.db[collection_name].find_one(sort=[("id", DESCENDING)])
+                max_doc = await self.db[collection_name].find_one(sort=[("id", DESCENDING)])
                 if max_doc and max_doc.get("id") is not None:
-                    self._set_counter_floor(counter_name, int(max_doc["id"]))
-
+                    await self._set_counter_floor(counter_name, int(max_doc["id"]))
+
+            if migrated.get("view_statistics"):
+                await self.backfill_view_rollups()
+            await self.reconcile_stats()
+
+            self.settings_cache.invalidate()
+            self.movie_cache.clear()
+            self.episode_cache.clear()
+            self.channel_snapshot.invalidate()
+            await self.rebuild_title_index(force=True)
+            await self._bump_catalog_version()
             logger.info("SQLite -> MongoDB migration completed: %s", migrated)
             return True
         except Exception as exc:
@@ -1057,5 +2104,76 @@ class Database:
         finally:
             conn.close()
 
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._jobs.append(task)
+        return task
+
+    @staticmethod
+    async def _every(interval: float, job, label: str, initial_delay: Optional[float] = None):
+        await asyncio.sleep(interval if initial_delay is None else initial_delay)
+        while True:
+            try:
+                await job()
+            except Exception:
+                logger.exception("%s failed", label)
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        for task in self._jobs:
+            task.cancel()
+        for task in self._jobs:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._jobs.clear()
+        try:
+            if self._sketches_seeded:
+                await self.checkpoint_search_sketches()
+                await self.checkpoint_activity_sketches()
+        except PyMongoError as exc:
+            logger.error("Analytics sketch checkpoint failed: %s", exc)
+        try:
+            await self.stats_buffer.stop()
+        except Exception:
+            logger.exception("Stats buffer shutdown failed")
+        await self.client.close()
+
+
+class Database:
+    """Blocking facade over AsyncDatabase for scripts and one-off maintenance jobs.
+
+    The bot itself awaits AsyncDatabase directly. This wrapper runs the same
+    coroutines on a private event loop thread, so synchronous callers keep the
+    old call style without a second copy of every query.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="database-loop", daemon=True)
+        self._thread.start()
+        self._async_db = AsyncDatabase(*args, **kwargs)
+        self._run(self._async_db.start())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._async_db, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return self._run(attr(*args, **kwargs))
+
+        return call
+
     def close(self):
-        self.client.close()
+        try:
+            self._run(self._async_db.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
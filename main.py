@@ -2,12 +2,13 @@ import os
 import random
 import asyncio
 import re
+import html
 import difflib
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Tuple
-from database import Database
+from database import AsyncDatabase
 import logging
-from aiogram import Bot, Dispatcher, types, F, Router
+from aiogram import BaseMiddleware, Bot, Dispatcher, types, F, Router
 from aiogram.client.default import DefaultBotProperties
 from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.types import (
@@ -18,9 +19,12 @@ from aiogram.types import (
     FSInputFile,
     Message,
     CallbackQuery,
-    ErrorEvent
+    ErrorEvent,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )
-from aiogram.exceptions import TelegramNetworkError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -84,20 +88,20 @@ class AdminStates(StatesGroup):
     delete_movie_waiting_code = State()
 
 # Initialize database
-db = Database(default_premium_price=PREMIUM_PRICE_MONTHLY, default_card_number=CARD_NUMBER, default_card_owner=CARD_OWNER)
+db = AsyncDatabase(default_premium_price=PREMIUM_PRICE_MONTHLY, default_card_number=CARD_NUMBER, default_card_owner=CARD_OWNER)
 
-def get_premium_price_monthly() -> int:
-    value = db.get_setting("premium_price_monthly", str(PREMIUM_PRICE_MONTHLY))
+async def get_premium_price_monthly() -> int:
+    value = await db.get_setting("premium_price_monthly", str(PREMIUM_PRICE_MONTHLY))
     try:
         return int(str(value).replace(" ", "").replace(",", ""))
     except Exception:
         return PREMIUM_PRICE_MONTHLY
 
-def get_card_number() -> str:
-    return db.get_setting("card_number", CARD_NUMBER) or CARD_NUMBER
+async def get_card_number() -> str:
+    return (await db.get_setting("card_number", CARD_NUMBER)) or CARD_NUMBER
 
-def get_card_owner() -> str:
-    return db.get_setting("card_owner", CARD_OWNER) or CARD_OWNER
+async def get_card_owner() -> str:
+    return (await db.get_setting("card_owner", CARD_OWNER)) or CARD_OWNER
 
 # ================================
 # KEYBOARDS
@@ -208,7 +212,7 @@ def build_subscription_text(channels: List[tuple], statuses: Optional[Dict[str,
     text += "\n\nObuna bo'lgandan keyin pastdagi tugmani bosing."
     return text
 
-def get_movie_keyboard(movie_id: int, category: str, is_series: bool = False):
+async def get_movie_keyboard(movie_id: int, category: str, is_series: bool = False):
     """Create keyboard for movie"""
     buttons = []
     
@@ -216,7 +220,7 @@ def get_movie_keyboard(movie_id: int, category: str, is_series: bool = False):
         buttons.append([InlineKeyboardButton(text="📺 Barcha qismlar", callback_data=f"episodes_{movie_id}")])
     else:
         # Similar movies
-        similar = db.get_similar_movies(movie_id, category, 3)
+        similar = await db.get_similar_movies(movie_id, category, 3)
         for movie in similar:
             buttons.append([InlineKeyboardButton(
                 text=f"🎬 {movie[1]}", 
@@ -227,9 +231,8 @@ def get_movie_keyboard(movie_id: int, category: str, is_series: bool = False):
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_episodes_keyboard(movie_id: int, episodes: List[tuple], page: int = 1, per_page: int = 10):
+def get_episodes_keyboard(movie_id: int, ep_nums: List[int], page: int = 1, per_page: int = 10):
     """Create numeric keypad for series episodes (paged)"""
-    ep_nums = [e[2] for e in episodes]
     total = len(ep_nums)
     if total == 0:
         return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="🔙 Orqaga", callback_data=f"movie_{movie_id}")]])
@@ -289,7 +292,7 @@ async def get_subscription_statuses(user_id: int, channels: List[tuple]) -> Tupl
         is_subscribed = await check_subscription(user_id, channel_id)
         statuses[channel_id] = is_subscribed
         if is_subscribed:
-            db.mark_subscription(user_id, channel_id)
+            await db.mark_subscription(user_id, channel_id)
         else:
             all_subscribed = False
 
@@ -321,15 +324,24 @@ def filter_clickable_channels(channels: List[tuple]) -> List[tuple]:
     return filtered
 
 
-async def enforce_subscription(message: Message, user_id: int) -> bool:
-    """Enforce mandatory subscription."""
-    if db.is_premium(user_id):
+async def enforce_subscription(message: Optional[Message], user_id: int) -> bool:
+    """Enforce mandatory subscription.
+
+    Without a ``message`` (buttons on inline-mode results) the prompt goes to
+    the user's private chat.
+    """
+    if await db.is_premium(user_id):
         return True
 
-    channels = db.get_daily_channels(user_id)
+    async def answer(text: str, **kwargs):
+        if message is not None:
+            return await message.answer(text, **kwargs)
+        return await bot.send_message(user_id, text, **kwargs)
+
+    channels = await db.get_daily_channels(user_id)
 
     if not channels:
-        await message.answer(
+        await answer(
             "Hozircha majburiy obuna kanallari mavjud emas.\n"
             "Admin bilan bog'laning."
         )
@@ -337,7 +349,7 @@ async def enforce_subscription(message: Message, user_id: int) -> bool:
 
     clickable_channels = filter_clickable_channels(channels)
     if not clickable_channels:
-        await message.answer(
+        await answer(
             "Majburiy obuna kanallari noto'g'ri sozlangan. "
             "Admin kanallarga invite link qo'shishi kerak."
         )
@@ -347,7 +359,7 @@ async def enforce_subscription(message: Message, user_id: int) -> bool:
     if all_subscribed:
         return True
 
-    await message.answer(
+    await answer(
         build_subscription_text(clickable_channels, statuses),
         reply_markup=get_subscription_keyboard(clickable_channels)
     )
@@ -567,13 +579,13 @@ def parse_title_and_episode(text: str) -> Tuple[Optional[str], Optional[int]]:
 
     return normalize_title(line), None
 
-def generate_code_from_title(title: str) -> str:
+async def generate_code_from_title(title: str) -> str:
     base = re.sub(r"[^A-Za-z0-9]", "", title.upper())[:6]
     if not base:
         base = "MOV"
     for _ in range(10):
         code = f"{base}{random.randint(100, 999)}"
-        if not db.is_code_exists(code):
+        if not await db.is_code_exists(code):
             return code
     return f"{base}{random.randint(1000, 9999)}"
 
@@ -641,12 +653,12 @@ async def handle_telegram_network_errors(event: ErrorEvent):
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     user = message.from_user
-    db.add_user(user.id, user.username, user.first_name, user.last_name)
+    await db.add_user(user.id, user.username, user.first_name, user.last_name)
     
     if not await enforce_subscription(message, user.id):
         return
     
-    is_premium = db.is_premium(user.id)
+    is_premium = await db.is_premium(user.id)
 
     # Clear any previous state on /start
     await state.clear()
@@ -675,7 +687,7 @@ async def cmd_start(message: Message, state: FSMContext):
 @router.callback_query(F.data == "check_sub")
 async def callback_check_subscription(callback: CallbackQuery):
     user_id = callback.from_user.id
-    channels = db.get_daily_channels(user_id)
+    channels = await db.get_daily_channels(user_id)
     clickable_channels = filter_clickable_channels(channels)
 
     if not clickable_channels:
@@ -692,7 +704,7 @@ async def callback_check_subscription(callback: CallbackQuery):
             await callback.message.answer("Obuna tasdiqlandi. Endi botdan to'liq foydalanishingiz mumkin.")
         await callback.message.answer(
             "Qidirish uchun kino nomi yoki kodini yuboring.",
-            reply_markup=get_main_keyboard(db.is_premium(user_id), user_id in ADMIN_IDS)
+            reply_markup=get_main_keyboard(await db.is_premium(user_id), user_id in ADMIN_IDS)
         )
         await callback.answer("Tasdiqlandi")
     else:
@@ -718,7 +730,7 @@ async def cmd_cancel(message: Message, state: FSMContext):
     else:
         await message.answer(
             "Bekor qilindi",
-            reply_markup=get_main_keyboard(db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
+            reply_markup=get_main_keyboard(await db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
         )
 
 
@@ -747,11 +759,9 @@ async def run_search(message: Message, query: str, state: FSMContext | None = No
             await state.clear()
         return
 
-    results = db.search_movies(query, limit=6)
+    results, is_fuzzy = await db.search_catalog(query, limit=6)
 
-    if not results:
-        # Fuzzy search fallback
-        results = db.search_movies_fuzzy(query, limit=6)
+    if is_fuzzy or not results:
         if results:
             keyboard = get_search_results_keyboard(results)
             await message.answer(
@@ -759,22 +769,22 @@ async def run_search(message: Message, query: str, state: FSMContext | None = No
                 "Keraklisini tanlang:",
                 reply_markup=keyboard
             )
-            db.add_search_stat(message.from_user.id, query, True)
+            await db.add_search_stat(message.from_user.id, query, True)
             if state:
                 await state.clear()
             return
 
-        db.add_search_stat(message.from_user.id, query, False)
+        await db.add_search_stat(message.from_user.id, query, False)
         await message.answer(
             "😕 <b>Bu media hozircha bazada yo'q</b>\n\n"
             "Iltimos, boshqa nom yoki kod bilan qidirib ko'ring.",
-            reply_markup=get_main_keyboard(db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
+            reply_markup=get_main_keyboard(await db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
         )
         if state:
             await state.clear()
         return
 
-    db.add_search_stat(message.from_user.id, query, True)
+    await db.add_search_stat(message.from_user.id, query, True)
 
     if len(results) > 1:
         keyboard = get_search_results_keyboard(results)
@@ -788,8 +798,8 @@ async def run_search(message: Message, query: str, state: FSMContext | None = No
         return
 
     movie = results[0]
-    db.increment_movie_views(movie[0])
-    db.add_view_stat(message.from_user.id, movie[0])
+    await db.increment_movie_views(movie[0])
+    await db.add_view_stat(message.from_user.id, movie[0])
 
     movie_id, title, code, file_id, file_type, media_type, category, description, year, rating, views, added_date, is_active, *rest = movie
     source_chat_id = rest[0] if len(rest) > 0 else None
@@ -799,12 +809,12 @@ async def run_search(message: Message, query: str, state: FSMContext | None = No
 
     is_series = (media_type == "series")
     if is_series:
-        episodes = db.get_series_episodes(movie_id)
-        keyboard = get_episodes_keyboard(movie_id, episodes, page=1)
+        ep_nums = await db.get_episode_numbers(movie_id)
+        keyboard = get_episodes_keyboard(movie_id, ep_nums, page=1)
         text = f"📺 <b>{title}</b>\n\nQismni tanlang:"
         await message.answer(text, reply_markup=keyboard)
     else:
-        keyboard = get_movie_keyboard(movie_id, category, is_series)
+        keyboard = await get_movie_keyboard(movie_id, category, is_series)
         try:
             if file_type == "channel" and source_chat_id and source_message_id:
                 from_chat = int(source_chat_id) if str(source_chat_id).lstrip('-').isdigit() else source_chat_id
@@ -861,6 +871,27 @@ async def quick_search(message: Message, state: FSMContext):
         return
     await run_search(message, text, state)
 
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    matches = await db.autocomplete(inline_query.query, limit=20)
+    results = []
+    for movie_id, title, code, media_type in matches:
+        tag = "Serial" if media_type == "series" else "Kino"
+        results.append(
+            InlineQueryResultArticle(
+                id=str(movie_id),
+                title=title,
+                description=f"{tag} • Kod: {code}",
+                input_message_content=InputTextMessageContent(
+                    message_text=f"🎬 <b>{html.escape(title)}</b>\n🔑 Kod: <code>{html.escape(code)}</code>"
+                ),
+                reply_markup=InlineKeyboardMarkup(
+                    inline_keyboard=[[InlineKeyboardButton(text="▶️ Ko'rish", callback_data=f"movie_{movie_id}")]]
+                ),
+            )
+        )
+    await inline_query.answer(results, cache_time=30)
+
 # ================================
 # CHANNEL AUTO-INDEXING
 # ================================
@@ -887,7 +918,7 @@ async def categories_menu(message: Message):
 async def callback_category(callback: CallbackQuery):
     category = callback.data.split("_")[1]
     
-    movies = db.get_movies_by_category(category, 10)
+    movies = await db.get_movies_by_category(category, 10)
     
     if not movies:
         await callback.answer("Bu kategoriyada hozircha kino yo'q", show_alert=True)
@@ -912,52 +943,74 @@ async def callback_category(callback: CallbackQuery):
 async def callback_movie(callback: CallbackQuery):
     movie_id = int(callback.data.split("_")[1])
     
-    movie = db.get_movie_by_id(movie_id)
+    movie = await db.get_movie_by_id(movie_id)
     
     if not movie:
         await callback.answer("Kino topilmadi", show_alert=True)
         return
+
+    # Inline-mode results reach this handler without passing any gated flow.
+    if callback.message is None:
+        try:
+            subscribed = await enforce_subscription(None, callback.from_user.id)
+        except TelegramForbiddenError:
+            await callback.answer("Avval botga /start bosing", show_alert=True)
+            return
+        if not subscribed:
+            await callback.answer("Avval kanallarga obuna bo'ling", show_alert=True)
+            return
     
-    db.increment_movie_views(movie_id)
-    db.add_view_stat(callback.from_user.id, movie_id)
+    await db.increment_movie_views(movie_id)
+    await db.add_view_stat(callback.from_user.id, movie_id)
     
     movie_id, title, code, file_id, file_type, media_type, category, description, year, rating, views, added_date, is_active, *rest = movie
     source_chat_id = rest[0] if len(rest) > 0 else None
     source_message_id = rest[1] if len(rest) > 1 else None
     
     caption = format_movie_info(movie)
+    # Buttons on inline-mode results carry no message; deliver to the user's private chat.
+    chat_id = callback.message.chat.id if callback.message else callback.from_user.id
 
-    is_series = (media_type == "series")
-    if is_series:
-        episodes = db.get_series_episodes(movie_id)
-        keyboard = get_episodes_keyboard(movie_id, episodes, page=1)
-        text = f"📺 <b>{title}</b>\n\nQismni tanlang:"
+    async def delete_source_message():
+        if callback.message is None:
+            return
         try:
             await callback.message.delete()
         except Exception:
             pass
-        await bot.send_message(callback.message.chat.id, text, reply_markup=keyboard)
-    else:
-        keyboard = get_movie_keyboard(movie_id, category, is_series)
+
+    is_series = (media_type == "series")
+    if is_series:
+        ep_nums = await db.get_episode_numbers(movie_id)
+        keyboard = get_episodes_keyboard(movie_id, ep_nums, page=1)
+        text = f"📺 <b>{title}</b>\n\nQismni tanlang:"
+        await delete_source_message()
         try:
-            await callback.message.delete()
-        except Exception:
-            pass
+            await bot.send_message(chat_id, text, reply_markup=keyboard)
+        except TelegramForbiddenError:
+            await callback.answer("Avval botga /start bosing", show_alert=True)
+            return
+    else:
+        keyboard = await get_movie_keyboard(movie_id, category, is_series)
+        await delete_source_message()
         try:
             if file_type == "channel" and source_chat_id and source_message_id:
                 from_chat = int(source_chat_id) if str(source_chat_id).lstrip('-').isdigit() else source_chat_id
                 await bot.copy_message(
-                    chat_id=callback.message.chat.id,
+                    chat_id=chat_id,
                     from_chat_id=from_chat,
                     message_id=int(source_message_id),
                     reply_markup=keyboard
                 )
-                await bot.send_message(callback.message.chat.id, caption, reply_markup=keyboard)
+                await bot.send_message(chat_id, caption, reply_markup=keyboard)
             else:
-                await send_media(callback.message.chat.id, file_id, file_type, caption, keyboard)
+                await send_media(chat_id, file_id, file_type, caption, keyboard)
+        except TelegramForbiddenError:
+            await callback.answer("Avval botga /start bosing", show_alert=True)
+            return
         except Exception as e:
             logger.error(f"Error sending video: {e}")
-            await callback.message.answer("❌ Video yuborilmadi. Kanalga bot qo‘shilganini tekshiring.")
+            await bot.send_message(chat_id, "❌ Video yuborilmadi. Kanalga bot qo‘shilganini tekshiring.")
     
     try:
         await callback.answer()
@@ -973,22 +1026,22 @@ async def callback_episodes(callback: CallbackQuery):
     movie_id = int(parts[1])
     page = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 1
     
-    episodes = db.get_series_episodes(movie_id)
+    ep_nums = await db.get_episode_numbers(movie_id)
     
-    if not episodes:
+    if not ep_nums:
         await callback.answer("Qismlar topilmadi", show_alert=True)
         return
     
-    series_title = db.get_movie_title(movie_id)
+    series_title = await db.get_movie_title(movie_id)
     if not series_title:
         await callback.answer("Serial topilmadi", show_alert=True)
         return
     
     text = f"📺 <b>{series_title}</b>\n\n"
-    text += f"Jami qismlar: {len(episodes)}\n\n"
+    text += f"Jami qismlar: {len(ep_nums)}\n\n"
     text += "Qismni tanlang:"
     
-    keyboard = get_episodes_keyboard(movie_id, episodes, page=page)
+    keyboard = get_episodes_keyboard(movie_id, ep_nums, page=page)
     
     # If the original message has no text (e.g., it's a video with caption),
     # edit_caption should be used instead of edit_text.
@@ -1006,7 +1059,7 @@ async def callback_episode(callback: CallbackQuery):
     movie_id = int(parts[1])
     episode_num = int(parts[2])
     
-    episode = db.get_episode(movie_id, episode_num)
+    episode = await db.get_episode(movie_id, episode_num)
     
     if not episode:
         await callback.answer("Qism topilmadi", show_alert=True)
@@ -1021,7 +1074,7 @@ async def callback_episode(callback: CallbackQuery):
     source_chat_id = episode[7] if len(episode) > 7 else None
     source_message_id = episode[8] if len(episode) > 8 else None
     
-    series_info = db.get_movie_title_and_code(movie_id)
+    series_info = await db.get_movie_title_and_code(movie_id)
     if not series_info:
         await callback.answer("Serial topilmadi", show_alert=True)
         return
@@ -1033,7 +1086,7 @@ async def callback_episode(callback: CallbackQuery):
     
     # Next episode button
     buttons = []
-    next_episode = db.get_episode(movie_id, episode_num + 1)
+    next_episode = await db.get_episode(movie_id, episode_num + 1)
     if next_episode:
         buttons.append([InlineKeyboardButton(
             text=f"▶️ Keyingi qism ({episode_num + 1})",
@@ -1072,14 +1125,14 @@ async def trending_menu(message: Message):
     if not await enforce_subscription(message, message.from_user.id):
         return
     
-    trending = db.get_trending_movies(7, 10)
+    trending = await db.get_trending_movies(db.trending.days, 10)
     
     if not trending:
         await message.answer("Hozircha trend medialar yo'q")
         return
     
     text = "🔥 <b>TOP 10 Trend Media</b>\n"
-    text += "<i>(So'nggi 7 kun)</i>\n\n"
+    text += f"<i>(So'nggi {db.trending.days} kun)</i>\n\n"
     
     buttons = []
     for i, movie in enumerate(trending, 1):
@@ -1108,7 +1161,7 @@ async def recommendations_menu(message: Message):
     buttons = []
     
     for category in categories:
-        movies = db.get_movies_by_category(category, 1)
+        movies = await db.get_movies_by_category(category, 1)
         if movies:
             movie = movies[0]
             movie_id = movie[0]
@@ -1133,8 +1186,8 @@ async def recommendations_menu(message: Message):
 async def premium_menu(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
-    if db.is_premium(user_id):
-        user = db.get_user(user_id)
+    if await db.is_premium(user_id):
+        user = await db.get_user(user_id)
         premium_until = datetime.fromisoformat(user[6]).strftime("%d.%m.%Y %H:%M")
         
         await message.answer(
@@ -1147,8 +1200,9 @@ async def premium_menu(message: Message, state: FSMContext):
             f"🔔 Reklamasiz"
         )
     else:
+        price = await get_premium_price_monthly()
         buttons = [
-            [InlineKeyboardButton(text=f"💳 Premium sotib olish ({get_premium_price_monthly():,} so'm)", callback_data="buy_premium")]
+            [InlineKeyboardButton(text=f"💳 Premium sotib olish ({price:,} so'm)", callback_data="buy_premium")]
         ]
         await message.answer(
             f"💎 <b>Premium xizmat</b>\n\n"
@@ -1157,9 +1211,9 @@ async def premium_menu(message: Message, state: FSMContext):
             f"🚀 Tez yuklab olish\n"
             f"🎯 Maxsus AI tavsiyalar\n"
             f"🔔 Reklamasiz\n\n"
-            f"💰 <b>Narx:</b> {get_premium_price_monthly():,} so'm/oy\n\n"
-            f"💳 <b>Karta:</b> {get_card_number()}\n"
-            f"👤 <b>Ism:</b> {get_card_owner()}\n\n"
+            f"💰 <b>Narx:</b> {price:,} so'm/oy\n\n"
+            f"💳 <b>Karta:</b> {await get_card_number()}\n"
+            f"👤 <b>Ism:</b> {await get_card_owner()}\n\n"
             f"Chekni yuboring.",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
         )
@@ -1169,9 +1223,9 @@ async def premium_menu(message: Message, state: FSMContext):
 async def callback_buy_premium(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
         f"💎 <b>Premium xizmat</b>\n\n"
-        f"💰 <b>Narx:</b> {get_premium_price_monthly():,} so'm/oy\n"
-        f"💳 <b>Karta:</b> {get_card_number()}\n"
-        f"👤 <b>Ism:</b> {get_card_owner()}\n\n"
+        f"💰 <b>Narx:</b> {await get_premium_price_monthly():,} so'm/oy\n"
+        f"💳 <b>Karta:</b> {await get_card_number()}\n"
+        f"👤 <b>Ism:</b> {await get_card_owner()}\n\n"
         f"Chekni yuboring."
     )
     await state.set_state(UserStates.waiting_payment)
@@ -1182,7 +1236,8 @@ async def callback_buy_premium(callback: CallbackQuery, state: FSMContext):
 
 @router.message(UserStates.waiting_payment, F.photo)
 async def payment_photo(message: Message, state: FSMContext):
-    payment_id = db.create_payment(message.from_user.id, get_premium_price_monthly(), "card")
+    price = await get_premium_price_monthly()
+    payment_id = await db.create_payment(message.from_user.id, price, "card")
     for admin_id in ADMIN_IDS:
         try:
             await bot.forward_message(admin_id, message.chat.id, message.message_id)
@@ -1192,7 +1247,7 @@ async def payment_photo(message: Message, state: FSMContext):
             ]])
             await bot.send_message(
                 admin_id,
-                f"Chek\nUser: {message.from_user.id}\nSumma: {get_premium_price_monthly():,} so'm",
+                f"Chek\nUser: {message.from_user.id}\nSumma: {price:,} so'm",
                 reply_markup=buttons
             )
         except Exception:
@@ -1204,13 +1259,14 @@ async def payment_photo(message: Message, state: FSMContext):
 async def payment_cancel_or_text(message: Message, state: FSMContext):
     if message.text == "/cancel":
         await state.clear()
-        await message.answer("❌ Bekor qilindi", reply_markup=get_main_keyboard(db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS))
+        await message.answer("❌ Bekor qilindi", reply_markup=get_main_keyboard(await db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS))
         return
     await message.answer("❌ Chekni rasm yoki fayl ko‘rinishida yuboring. Bekor qilish: /cancel")
 
 @router.message(UserStates.waiting_payment, F.document)
 async def payment_doc(message: Message, state: FSMContext):
-    payment_id = db.create_payment(message.from_user.id, get_premium_price_monthly(), "card")
+    price = await get_premium_price_monthly()
+    payment_id = await db.create_payment(message.from_user.id, price, "card")
     for admin_id in ADMIN_IDS:
         try:
             await bot.forward_message(admin_id, message.chat.id, message.message_id)
@@ -1220,7 +1276,7 @@ async def payment_doc(message: Message, state: FSMContext):
             ]])
             await bot.send_message(
                 admin_id,
-                f"Chek\nUser: {message.from_user.id}\nSumma: {get_premium_price_monthly():,} so'm",
+                f"Chek\nUser: {message.from_user.id}\nSumma: {price:,} so'm",
                 reply_markup=buttons
             )
         except Exception:
@@ -1237,7 +1293,7 @@ async def payment_decision(callback: CallbackQuery):
             pass
         return
     action, payment_id = callback.data.split("_", 2)[1], callback.data.split("_", 2)[2]
-    pay = db.get_payment(int(payment_id))
+    pay = await db.get_payment(int(payment_id))
     if not pay:
         await callback.message.answer("Topilmadi")
         try:
@@ -1247,12 +1303,12 @@ async def payment_decision(callback: CallbackQuery):
         return
     user_id = pay[1]
     if action == "ok":
-        db.update_payment_status(int(payment_id), "approved")
-        db.add_premium(user_id, days=30)
+        await db.update_payment_status(int(payment_id), "approved")
+        await db.add_premium(user_id, days=30)
         await bot.send_message(user_id, "✅ Premium aktiv")
         await callback.message.answer("✅ Tasdiqlandi")
     else:
-        db.update_payment_status(int(payment_id), "denied")
+        await db.update_payment_status(int(payment_id), "denied")
         await bot.send_message(user_id, "❌ Chek rad")
         await callback.message.answer("❌ Rad etildi")
     try:
@@ -1316,9 +1372,9 @@ async def admin_premium_settings(message: Message, state: FSMContext):
     await state.clear()
     text = (
         "💳 <b>Premium sozlamalar</b>\n\n"
-        f"💰 <b>Narx:</b> {get_premium_price_monthly():,} so'm/oy\n"
-        f"💳 <b>Karta:</b> {get_card_number()}\n"
-        f"👤 <b>Ism:</b> {get_card_owner()}\n\n"
+        f"💰 <b>Narx:</b> {await get_premium_price_monthly():,} so'm/oy\n"
+        f"💳 <b>Karta:</b> {await get_card_number()}\n"
+        f"👤 <b>Ism:</b> {await get_card_owner()}\n\n"
         "Quyidan birini tanlang:"
     )
     await message.answer(text, reply_markup=get_premium_settings_keyboard())
@@ -1362,7 +1418,7 @@ async def admin_premium_price_save(message: Message, state: FSMContext):
     if not raw.isdigit():
         await message.answer("❌ Noto'g'ri format! Faqat raqam kiriting.")
         return
-    db.set_setting("premium_price_monthly", raw)
+    await db.set_setting("premium_price_monthly", raw)
     await state.clear()
     await message.answer("✅ Premium narxi yangilandi.", reply_markup=get_premium_settings_keyboard())
 
@@ -1378,7 +1434,7 @@ async def admin_card_number_save(message: Message, state: FSMContext):
     if not value:
         await message.answer("❌ Karta raqami bo'sh bo'lishi mumkin emas.")
         return
-    db.set_setting("card_number", value)
+    await db.set_setting("card_number", value)
     await state.clear()
     await message.answer("✅ Karta raqami yangilandi.", reply_markup=get_premium_settings_keyboard())
 
@@ -1394,7 +1450,7 @@ async def admin_card_owner_save(message: Message, state: FSMContext):
     if not value:
         await message.answer("❌ Ism bo'sh bo'lishi mumkin emas.")
         return
-    db.set_setting("card_owner", value)
+    await db.set_setting("card_owner", value)
     await state.clear()
     await message.answer("✅ Karta egasi yangilandi.", reply_markup=get_premium_settings_keyboard())
 
@@ -1403,12 +1459,14 @@ async def admin_statistics(message: Message):
     if message.from_user.id not in ADMIN_IDS:
         return
     
-    stats = db.get_statistics()
+    stats = await db.get_statistics()
     
     text = "📊 <b>Bot Statistikasi</b>\n\n"
     text += f"👥 Jami foydalanuvchilar: <b>{stats['total_users']}</b>\n"
     text += f"💎 Premium foydalanuvchilar: <b>{stats['premium_users']}</b>\n"
-    text += f"📈 Bugungi faol foydalanuvchilar: <b>{stats['today_active']}</b>\n\n"
+    text += f"📈 Bugungi faol foydalanuvchilar: <b>{stats['today_active']}</b>\n"
+    text += f"📅 Haftalik faol: <b>{stats['weekly_active']}</b>\n"
+    text += f"🗓 Oylik faol: <b>{stats['monthly_active']}</b>\n\n"
     
     text += f"🎬 Jami kinolar: <b>{stats['total_movies']}</b>\n"
     text += f"📺 Jami seriallar: <b>{stats['total_series']}</b>\n\n"
@@ -1420,24 +1478,54 @@ async def admin_statistics(message: Message):
     
     await message.answer(text)
 
+TOP_SEARCH_WINDOWS = (1, 7, 30)
+
+
+async def build_top_searches_view(days: int):
+    searches = await db.get_top_searches(10, days)
+    
+    text = "📊 <b>TOP 10 Qidiruvlar</b>\n"
+    text += f"<i>(So'nggi {days} kun)</i>\n\n"
+    
+    if not searches:
+        text += "Hozircha qidiruvlar yo'q"
+    for i, (query, count) in enumerate(searches, 1):
+        text += f"{i}. <code>{html.escape(query)}</code> - {count} marta\n"
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(
+            text=f"{'✅ ' if window == days else ''}{window} kun",
+            callback_data=f"topsearch_{window}"
+        )
+        for window in TOP_SEARCH_WINDOWS
+    ]])
+    return text, keyboard
+
 @router.message(F.text == "📊 Top qidiruvlar")
 async def admin_top_searches(message: Message):
     if message.from_user.id not in ADMIN_IDS:
         return
     
-    searches = db.get_top_searches(10)
-    
-    if not searches:
-        await message.answer("Hozircha qidiruvlar yo'q")
+    text, keyboard = await build_top_searches_view(7)
+    await message.answer(text, reply_markup=keyboard)
+
+@router.callback_query(F.data.startswith("topsearch_"))
+async def admin_top_searches_window(callback: CallbackQuery):
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("Sizda huquq yo'q", show_alert=True)
         return
     
-    text = "📊 <b>TOP 10 Qidiruvlar</b>\n"
-    text += "<i>(So'nggi 7 kun)</i>\n\n"
-    
-    for i, (query, count) in enumerate(searches, 1):
-        text += f"{i}. <code>{query}</code> - {count} marta\n"
+    raw_days = callback.data.replace("topsearch_", "", 1)
+    if not raw_days.isdigit() or int(raw_days) not in TOP_SEARCH_WINDOWS:
+        await callback.answer("Noto'g'ri so'rov", show_alert=True)
+        return
     
-    await message.answer(text)
+    text, keyboard = await build_top_searches_view(int(raw_days))
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
 
 # ===== ADMIN: ADD CHANNEL =====
 @router.message(F.text == "Majburiy kanal qo'shish")
@@ -1562,7 +1650,7 @@ async def admin_add_channel_type(callback: CallbackQuery, state: FSMContext):
     channel_username = resolved_username if resolved_username else (resolved_id.replace('@', '') if str(resolved_id).startswith('@') else None)
     channel_id = resolved_id
 
-    success = db.add_channel(channel_id, channel_name, channel_username, channel_type, invite_link=invite_link)
+    success = await db.add_channel(channel_id, channel_name, channel_username, channel_type, invite_link=invite_link)
 
     if success:
         await callback.message.edit_text(
@@ -1607,7 +1695,7 @@ async def admin_add_channel_invite(message: Message, state: FSMContext):
     channel_username = resolved_username if resolved_username else (resolved_id.replace('@', '') if str(resolved_id).startswith('@') else None)
     channel_id = resolved_id
 
-    success = db.add_channel(channel_id, channel_name, channel_username, channel_type, invite_link=invite_link)
+    success = await db.add_channel(channel_id, channel_name, channel_username, channel_type, invite_link=invite_link)
 
     if success:
         await message.answer(
@@ -1628,7 +1716,7 @@ async def admin_delete_channel_start(message: Message):
     if message.from_user.id not in ADMIN_IDS:
         return
 
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
     if not channels:
         await message.answer("Majburiy obuna kanallari hozircha yo'q.", reply_markup=get_admin_keyboard())
         return
@@ -1661,7 +1749,7 @@ async def admin_delete_channel_confirm(callback: CallbackQuery):
         return
 
     row_id = int(raw_id)
-    channels = db.get_all_channels()
+    channels = await db.get_all_channels()
     selected = next((channel for channel in channels if str(channel[0]) == str(row_id)), None)
 
     if not selected:
@@ -1671,7 +1759,7 @@ async def admin_delete_channel_confirm(callback: CallbackQuery):
 
     channel_id = str(selected[1])
     channel_name = selected[2] or channel_id
-    db.delete_channel(channel_id)
+    await db.delete_channel(channel_id)
 
     await callback.message.edit_text(
         f"✅ Majburiy kanal o'chirildi.\n\n"
@@ -1679,7 +1767,7 @@ async def admin_delete_channel_confirm(callback: CallbackQuery):
         f"ID: <code>{channel_id}</code>"
     )
 
-    remaining_channels = db.get_all_channels()
+    remaining_channels = await db.get_all_channels()
     if remaining_channels:
         await callback.message.answer(
             "Yana o'chirish uchun kanal tanlang:",
@@ -1724,7 +1812,7 @@ async def admin_delete_movie_process(message: Message, state: FSMContext):
         await message.answer("Kod bo'sh bo'lishi mumkin emas. Masalan: SPID001")
         return
 
-    movie = db.deactivate_movie_by_code(raw)
+    movie = await db.deactivate_movie_by_code(raw)
     if not movie:
         await message.answer(
             "Bu kod bo'yicha faol media topilmadi.\n"
@@ -1735,7 +1823,7 @@ async def admin_delete_movie_process(message: Message, state: FSMContext):
     movie_id, title, code, file_id, file_type, media_type, category, *_ = movie
     deleted_episodes = 0
     if media_type == "series":
-        deleted_episodes = db.delete_series_episodes(movie_id)
+        deleted_episodes = await db.delete_series_episodes(movie_id)
 
     text = (
         "Media o'chirildi.\n\n"
@@ -1926,7 +2014,7 @@ async def admin_add_movie_file(message: Message, state: FSMContext):
         await message.answer("Fayl turi noto?g?ri. Video yoki dokument yuboring.")
         return
 
-    movie_id = db.add_movie(
+    movie_id = await db.add_movie(
         title=data['title'],
         code=data['code'],
         file_id=file_id,
@@ -1977,7 +2065,7 @@ async def admin_add_movie_links(message: Message, state: FSMContext):
             await message.answer("Link yuboring. Masalan: https://t.me/c/xxxx/yyyy")
             return
         chat_id, msg_id = links[0]
-        movie_id = db.add_movie(
+        movie_id = await db.add_movie(
             title=data['title'],
             code=data['code'],
             file_id="channel",
@@ -2002,7 +2090,7 @@ async def admin_add_movie_links(message: Message, state: FSMContext):
         await message.answer("Serial uchun link yuboring. Har qatorda bitta link bo'lsin")
         return
 
-    movie_id = db.add_movie(
+    movie_id = await db.add_movie(
         title=data['title'],
         code=data['code'],
         file_id="series",
@@ -2020,7 +2108,7 @@ async def admin_add_movie_links(message: Message, state: FSMContext):
 
     ep_num = 1
     for chat_id, msg_id in links:
-        db.add_series_episode(
+        await db.add_series_episode(
             movie_id=movie_id,
             episode_number=ep_num,
             episode_title=f"{ep_num}-qism",
@@ -2058,7 +2146,7 @@ async def admin_add_episode_number(message: Message, state: FSMContext):
     if links:
         ep_num = 1
         for chat_id, msg_id in links:
-            db.add_series_episode(
+            await db.add_series_episode(
                 movie_id=movie_id,
                 episode_number=ep_num,
                 episode_title=f"{ep_num}-qism",
@@ -2107,7 +2195,7 @@ async def admin_add_episode_file(message: Message, state: FSMContext):
 
     episode_title = f"{episode_number}-qism"
 
-    success = db.add_series_episode(movie_id, episode_number, episode_title, file_id, file_type=file_type)
+    success = await db.add_series_episode(movie_id, episode_number, episode_title, file_id, file_type=file_type)
 
     if success:
         await message.answer(
@@ -2140,7 +2228,7 @@ async def admin_add_episode_links(message: Message, state: FSMContext):
 
     ep_num = data.get('episode_number', 1)
     for chat_id, msg_id in links:
-        success = db.add_series_episode(
+        success = await db.add_series_episode(
             movie_id=movie_id,
             episode_number=ep_num,
             episode_title=f"{ep_num}-qism",
@@ -2168,6 +2256,21 @@ async def admin_broadcast_start(message: Message, state: FSMContext):
     )
     await state.set_state(AdminStates.broadcast_waiting_message)
 
+# ===== ADMIN: VIEW ROLLUP BACKFILL =====
+@router.message(Command("backfill_views"))
+async def admin_backfill_views(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    status_message = await message.answer("⏳ Ko'rishlar statistikasi qayta hisoblanmoqda...")
+    try:
+        total = await db.backfill_view_rollups()
+    except Exception as e:
+        logger.error(f"View rollup backfill error: {e}")
+        await status_message.edit_text("❌ Statistikani qayta hisoblashda xatolik yuz berdi.")
+        return
+    await status_message.edit_text(f"✅ Tayyor! {total} ta kunlik yozuv yangilandi.")
+
 # ===== ADMIN: MANUAL CHANNEL SCAN =====
 @router.message(F.text == "📥 Kanalni skan qilish")
 async def admin_scan_channel_start(message: Message, state: FSMContext):
@@ -2227,15 +2330,15 @@ async def admin_scan_channel_process(message: Message, state: FSMContext):
         category = data["category"]
 
         # Avoid duplicates
-        if db.get_movie_by_source(chat_id, msg_id) or db.get_episode_by_source(chat_id, msg_id):
+        if await db.get_movie_by_source(chat_id, msg_id) or await db.get_episode_by_source(chat_id, msg_id):
             skipped += 1
             continue
 
         if ep_num is not None or media_type == "series":
-            series = db.find_series_by_title(title)
+            series = await db.find_series_by_title(title)
             if not series:
-                code = generate_code_from_title(title)
-                series_id = db.add_movie(
+                code = await generate_code_from_title(title)
+                series_id = await db.add_movie(
                     title=title,
                     code=code,
                     file_id="series",
@@ -2257,7 +2360,7 @@ async def admin_scan_channel_process(message: Message, state: FSMContext):
                 skipped += 1
                 continue
 
-            ok = db.add_series_episode(
+            ok = await db.add_series_episode(
                 movie_id=movie_id,
                 episode_number=ep_num,
                 episode_title=f"{ep_num}-qism",
@@ -2271,8 +2374,8 @@ async def admin_scan_channel_process(message: Message, state: FSMContext):
             else:
                 skipped += 1
         else:
-            code = generate_code_from_title(title)
-            movie_id = db.add_movie(
+            code = await generate_code_from_title(title)
+            movie_id = await db.add_movie(
                 title=title,
                 code=code,
                 file_id="channel",
@@ -2305,7 +2408,7 @@ async def admin_broadcast_send(message: Message, state: FSMContext):
         await message.answer("❌ Bekor qilindi", reply_markup=get_admin_keyboard())
         return
     
-    users = db.get_all_user_ids()
+    users = await db.get_all_user_ids()
     
     success = 0
     failed = 0
@@ -2344,7 +2447,7 @@ async def admin_back(message: Message):
     
     await message.answer(
         "🏠 Asosiy menyu",
-        reply_markup=get_main_keyboard(db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
+        reply_markup=get_main_keyboard(await db.is_premium(message.from_user.id), message.from_user.id in ADMIN_IDS)
     )
 
 # ================================
@@ -2355,7 +2458,7 @@ async def callback_back_main(callback: CallbackQuery):
     await callback.message.delete()
     await callback.message.answer(
         "🏠 Asosiy menyu",
-        reply_markup=get_main_keyboard(db.is_premium(callback.from_user.id), callback.from_user.id in ADMIN_IDS)
+        reply_markup=get_main_keyboard(await db.is_premium(callback.from_user.id), callback.from_user.id in ADMIN_IDS)
     )
     await callback.answer()
 
@@ -2371,19 +2474,44 @@ async def callback_back_categories(callback: CallbackQuery):
 # ================================
 # MAIN
 # ================================
+class ActivityMiddleware(BaseMiddleware):
+    """Counts every user that sends any update towards DAU/WAU/MAU."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            db.record_activity(user.id)
+        return await handler(event, data)
+
+background_tasks = set()
+
+async def log_startup_stats():
+    try:
+        stats = await db.get_statistics()
+    except Exception as e:
+        logger.error(f"Startup statistics error: {e}")
+        return
+    logger.info(f"📊 Total users: {stats['total_users']}")
+    logger.info(f"🎬 Total movies: {stats['total_movies']}")
+    logger.info(f"📢 Total channels: {stats['total_channels']}")
+
 async def on_startup():
     logger.info("🤖 Bot ishga tushmoqda...")
+    await db.start()
     logger.info(f"✅ Database initialized")
-    logger.info(f"📊 Total users: {db.get_statistics()['total_users']}")
-    logger.info(f"🎬 Total movies: {db.get_statistics()['total_movies']}")
-    logger.info(f"📢 Total channels: {db.get_statistics()['total_channels']}")
+    # Statistics are logged in the background so polling starts right away.
+    task = asyncio.create_task(log_startup_stats())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
     logger.info("✅ Bot tayyor!")
 
 async def on_shutdown():
     logger.info("🔴 Bot to'xtatilmoqda...")
+    await db.close()
 
 async def main():
     dp.include_router(router)
+    dp.update.outer_middleware(ActivityMiddleware())
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
@@ -0,0 +1,575 @@
+import bisect
+import difflib
+import heapq
+import itertools
+import random
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class TitleIndex:
+    """In-memory inverted index over the active catalog's titles and codes.
+
+    ``search`` runs the same stages as the Mongo query path (code, exact
+    title, prefix, substring, normalized prefix) against postings held in
+    memory and returns ranked movie ids; callers hydrate the winners from the
+    movie cache.
+
+    - tokens: every title word and its prefixes up to ``prefix_len`` chars
+    - trigrams: every 3-char window of the lowercased title, so substring
+      candidates are the intersection of the query's trigram postings
+    - norms: ``(title_norm, id)`` pairs kept sorted, so a transliterated
+      prefix lookup is a bisect
+    """
+
+    def __init__(self, prefix_len: int = 6, max_candidates: int = 2000):
+        self.prefix_len = max(1, int(prefix_len))
+        # Very short queries match most of the catalog; only this many
+        # candidates are checked and ranked.
+        self.max_candidates = max(1, int(max_candidates))
+        self.ready = False
+        self._titles: Dict[int, str] = {}
+        self._views: Dict[int, int] = {}
+        self._codes: Dict[str, int] = {}
+        self._code_of: Dict[int, str] = {}
+        self._exact: Dict[str, Set[int]] = {}
+        self._prefixes: Dict[str, Set[int]] = {}
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._norms: List[Tuple[str, int]] = []
+        self._norm_of: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    def load(self, docs: Iterable[dict]):
+        """Rebuild the index from active movie documents."""
+        self._titles.clear()
+        self._views.clear()
+        self._codes.clear()
+        self._code_of.clear()
+        self._exact.clear()
+        self._prefixes.clear()
+        self._trigrams.clear()
+        self._norms = []
+        self._norm_of.clear()
+        for doc in docs:
+            self.add(doc, sort=False)
+        self._norms.sort()
+        self.ready = True
+
+    def add(self, doc: dict, sort: bool = True):
+        if doc.get("id") is None or doc.get("is_active", 1) != 1:
+            return
+        movie_id = int(doc["id"])
+        self.remove(movie_id)
+        title = (doc.get("title") or "").lower()
+        self._titles[movie_id] = title
+        self._views[movie_id] = int(doc.get("views") or 0)
+        if doc.get("code"):
+            code = str(doc["code"]).upper()
+            self._codes[code] = movie_id
+            self._code_of[movie_id] = code
+        self._exact.setdefault(title.strip(), set()).add(movie_id)
+        for key in self._prefix_keys(title):
+            self._prefixes.setdefault(key, set()).add(movie_id)
+        for gram in _trigrams(title):
+            self._trigrams.setdefault(gram, set()).add(movie_id)
+        norm = doc.get("title_norm") or normalize_title(title)
+        if norm:
+            self._norm_of[movie_id] = norm
+            if sort:
+                bisect.insort(self._norms, (norm, movie_id))
+            else:
+                self._norms.append((norm, movie_id))
+
+    def remove(self, movie_id: int):
+        movie_id = int(movie_id)
+        title = self._titles.pop(movie_id, None)
+        if title is None:
+            return
+        self._views.pop(movie_id, None)
+        code = self._code_of.pop(movie_id, None)
+        if code is not None and self._codes.get(code) == movie_id:
+            del self._codes[code]
+        self._discard(self._exact, title.strip(), movie_id)
+        for key in self._prefix_keys(title):
+            self._discard(self._prefixes, key, movie_id)
+        for gram in _trigrams(title):
+            self._discard(self._trigrams, gram, movie_id)
+        norm = self._norm_of.pop(movie_id, None)
+        if norm is not None:
+            position = bisect.bisect_left(self._norms, (norm, movie_id))
+            if position < len(self._norms) and self._norms[position] == (norm, movie_id):
+                del self._norms[position]
+
+    def add_views(self, movie_id: int, count: int):
+        movie_id = int(movie_id)
+        if movie_id in self._views:
+            self._views[movie_id] += int(count)
+
+    def find_code(self, code: str) -> Optional[int]:
+        return self._codes.get((code or "").strip().upper())
+
+    def search(self, query: str, limit: int = 6) -> List[int]:
+        """Return ids from the first non-empty stage: exact, word prefix, substring, normalized prefix."""
+        q = (query or "").strip().lower()
+        if not q:
+            return []
+        for stage in (self._exact_ids, self._prefix_ids, self._substring_ids, self._norm_prefix_ids):
+            ids = stage(q)
+            if ids:
+                return self._rank(ids, limit)
+        return []
+
+    def _exact_ids(self, q: str) -> Set[int]:
+        return self._exact.get(q, set())
+
+    def _prefix_ids(self, q: str) -> Set[int]:
+        tokens = _TOKEN_RE.findall(q)
+        if not tokens:
+            return set()
+        candidates = self._prefixes.get(tokens[0][: self.prefix_len], set())
+        if tokens == [q] and len(q) <= self.prefix_len:
+            # The posting key is the query itself: every candidate matches.
+            return set(itertools.islice(candidates, self.max_candidates))
+        pattern = re.compile(r"(?<!\w)" + re.escape(q))
+        return {
+            movie_id
+            for movie_id in itertools.islice(candidates, self.max_candidates)
+            if pattern.search(self._titles[movie_id])
+        }
+
+    def _substring_ids(self, q: str) -> Set[int]:
+        grams = _trigrams(q)
+        if grams:
+            postings = sorted((self._trigrams.get(gram, set()) for gram in grams), key=len)
+            if not postings[0]:
+                return set()
+            candidates = set.intersection(*postings)
+        else:
+            candidates = self._titles.keys()
+        return {
+            movie_id
+            for movie_id in itertools.islice(candidates, self.max_candidates)
+            if q in self._titles[movie_id]
+        }
+
+    def _norm_prefix_ids(self, q: str, max_ids: int = 1000) -> Set[int]:
+        q_norm = normalize_title(q)
+        if not q_norm:
+            return set()
+        ids = set()
+        position = bisect.bisect_left(self._norms, (q_norm,))
+        while position < len(self._norms) and len(ids) < max_ids:
+            norm, movie_id = self._norms[position]
+            if not norm.startswith(q_norm):
+                break
+            ids.add(movie_id)
+            position += 1
+        return ids
+
+    def _rank(self, ids: Iterable[int], limit: int) -> List[int]:
+        return heapq.nsmallest(int(limit), ids, key=lambda movie_id: (-self._views.get(movie_id, 0), movie_id))
+
+    def _prefix_keys(self, title: str) -> Set[str]:
+        keys = set()
+        for token in _TOKEN_RE.findall(title):
+            for length in range(1, min(len(token), self.prefix_len) + 1):
+                keys.add(token[:length])
+        return keys
+
+    @staticmethod
+    def _discard(postings: Dict[str, Set[int]], key: str, movie_id: int):
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(movie_id)
+            if not ids:
+                del postings[key]
+
+
+# Russian and Uzbek Cyrillic to Uzbek Latin, so "Аватар" and "Avatar" fold alike.
+_CYRILLIC_TO_LATIN = str.maketrans(
+    {
+        "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+        "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+        "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "ts",
+        "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+        "я": "ya", "ў": "o", "қ": "q", "ғ": "g", "ҳ": "h", "і": "i", "є": "e", "ї": "yi",
+    }
+)
+
+
+def normalize_title(text: Optional[str]) -> str:
+    """Fold a title for matching: transliterate Cyrillic, keep lowercase ``[a-z0-9]``, cut runs of 3+ to 2.
+
+    This is the value stored in ``movies.title_norm``.
+    """
+    text = (text or "").lower().translate(_CYRILLIC_TO_LATIN)
+    text = re.sub(r"[^a-z0-9]+", "", text)
+    return re.sub(r"(.)\1{2,}", r"\1\1", text)
+
+
+def _padded_trigrams(norm: str) -> Set[str]:
+    return _trigrams(f" {norm} ") if norm else set()
+
+
+class TrigramMatcher:
+    """Vectorized trigram shortlist plus ``difflib`` re-rank for fuzzy title search.
+
+    Titles are folded with ``normalize_title`` and split into padded
+    trigrams. ``load`` builds an inverted CSR layout: ``indptr[g]`` ..
+    ``indptr[g + 1]`` slices ``indices`` to the rows containing trigram
+    ``g``. A query concatenates the postings of its trigrams and one
+    ``np.bincount`` yields the overlap with every title at once; the best
+    ``shortlist`` titles by Dice score are then re-scored with
+    ``SequenceMatcher.ratio`` so ``min_score`` keeps its previous meaning
+    and transposed letters still match.
+
+    Titles added after ``load`` are kept in a small side table, and removed
+    rows are masked out until the next rebuild.
+    """
+
+    def __init__(self, shortlist: int = 50):
+        self.shortlist = max(1, int(shortlist))
+        self.ready = False
+        self._vocab: Dict[str, int] = {}
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._indices = np.empty(0, dtype=np.int32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._sizes = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._norms: List[str] = []
+        self._row_of: Dict[int, int] = {}
+        self._extra: Dict[int, Tuple[str, Set[str]]] = {}
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._row_of) + len(self._extra)
+
+    @property
+    def churn(self) -> int:
+        """Side-table titles plus masked rows accumulated since ``load``."""
+        return len(self._extra) + self._dead
+
+    def load(self, docs: Iterable[dict]):
+        ids: List[int] = []
+        norms: List[str] = []
+        sizes: List[int] = []
+        postings: Dict[str, List[int]] = {}
+        for doc in docs:
+            if doc.get("id") is None or doc.get("is_active", 1) != 1:
+                continue
+            norm = doc.get("title_norm") or normalize_title(doc.get("title"))
+            grams = _padded_trigrams(norm)
+            if not grams:
+                continue
+            row = len(ids)
+            ids.append(int(doc["id"]))
+            norms.append(norm)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+
+        lengths = np.fromiter((len(rows) for rows in postings.values()), dtype=np.int64, count=len(postings))
+        indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        self._indices = np.fromiter(
+            itertools.chain.from_iterable(postings.values()), dtype=np.int32, count=int(indptr[-1])
+        )
+        self._indptr = indptr
+        self._vocab = {gram: column for column, gram in enumerate(postings)}
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._sizes = np.asarray(sizes, dtype=np.float32)
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._norms = norms
+        self._row_of = {movie_id: row for row, movie_id in enumerate(ids)}
+        self._extra = {}
+        self._dead = 0
+        self.ready = True
+
+    def add(self, doc: dict):
+        if doc.get("id") is None or doc.get("is_active", 1) != 1:
+            return
+        self.remove(doc["id"])
+        norm = doc.get("title_norm") or normalize_title(doc.get("title"))
+        if norm:
+            self._extra[int(doc["id"])] = (norm, _padded_trigrams(norm))
+
+    def remove(self, movie_id: int):
+        movie_id = int(movie_id)
+        row = self._row_of.pop(movie_id, None)
+        if row is not None:
+            self._alive[row] = False
+            self._dead += 1
+        self._extra.pop(movie_id, None)
+
+    def search(self, query: str, limit: int = 6, min_score: float = 0.45) -> List[int]:
+        """Return up to ``limit`` movie ids whose ratio is at least ``min_score``, best first."""
+        q_norm = normalize_title(query)
+        grams = _padded_trigrams(q_norm)
+        if not grams:
+            return []
+        candidates: List[Tuple[float, int, str]] = []
+
+        columns = [self._vocab[gram] for gram in grams if gram in self._vocab]
+        if columns and len(self._ids):
+            rows = np.concatenate([self._indices[self._indptr[c] : self._indptr[c + 1]] for c in columns])
+            overlap = np.bincount(rows, minlength=len(self._ids))
+            scores = 2.0 * overlap / (len(grams) + self._sizes)
+            scores[~self._alive] = 0.0
+            k = min(self.shortlist, len(scores))
+            best = np.argpartition(scores, len(scores) - k)[len(scores) - k :]
+            for row in best[scores[best] > 0]:
+                candidates.append((float(scores[row]), int(self._ids[row]), self._norms[row]))
+
+        for movie_id, (norm, title_grams) in self._extra.items():
+            overlap = len(grams & title_grams)
+            if overlap:
+                candidates.append((2.0 * overlap / (len(grams) + len(title_grams)), movie_id, norm))
+
+        candidates.sort(key=lambda item: -item[0])
+        scored = []
+        for _, movie_id, norm in candidates[: self.shortlist]:
+            ratio = difflib.SequenceMatcher(None, q_norm, norm).ratio()
+            if ratio >= min_score:
+                scored.append((ratio, movie_id))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [movie_id for _, movie_id in scored[: int(limit)]]
+
+
+class PrefixTrie:
+    """Character trie over folded titles and codes for as-you-type lookups.
+
+    Keys are ``normalize_title`` forms of the code, of the whole title and of
+    the title from every later word on, so "kun" finds "O‘tkan kunlar". Each
+    node keeps its ``top_k`` ids ranked by views, precomputed bottom-up on
+    ``load``, so a lookup is one walk of at most ``max_depth`` steps plus a
+    slice. Deeper queries filter the (small) subtree under the depth cap.
+
+    Nodes live in parallel lists indexed by node number; a child is always
+    numbered after its parent, so a reverse sweep visits children first.
+    ``add``, ``remove`` and ``add_views`` patch only the nodes along the
+    affected keys.
+    """
+
+    def __init__(self, top_k: int = 20, max_depth: int = 10):
+        self.top_k = max(1, int(top_k))
+        self.max_depth = max(1, int(max_depth))
+        self.ready = False
+        self._children: List[Dict[str, int]] = [{}]
+        self._terminal: List[Optional[Set[int]]] = [None]
+        self._top: List[List[int]] = [[]]
+        self._keys: Dict[int, Tuple[str, ...]] = {}
+        self._views: Dict[int, int] = {}
+        self._entries: Dict[int, Tuple[str, str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, docs: Iterable[dict]):
+        self._children = [{}]
+        self._terminal = [None]
+        self._top = [[]]
+        self._keys = {}
+        self._views = {}
+        self._entries = {}
+        for doc in docs:
+            if doc.get("id") is None or doc.get("is_active", 1) != 1:
+                continue
+            movie_id = self._register(doc)
+            if movie_id is None:
+                continue
+            for key in self._keys[movie_id]:
+                self._terminal_at(self._walk(key, create=True)[-1]).add(movie_id)
+        for node in range(len(self._children) - 1, -1, -1):
+            self._recompute(node)
+        self.ready = True
+
+    def add(self, doc: dict):
+        if doc.get("id") is None or doc.get("is_active", 1) != 1:
+            return
+        self.remove(doc["id"])
+        movie_id = self._register(doc)
+        if movie_id is None:
+            return
+        for key in self._keys[movie_id]:
+            path = self._walk(key, create=True)
+            self._terminal_at(path[-1]).add(movie_id)
+            for node in path:
+                self._promote(node, movie_id)
+
+    def add_views(self, movie_id: int, count: int):
+        movie_id = int(movie_id)
+        if movie_id not in self._views or count <= 0:
+            return
+        self._views[movie_id] += int(count)
+        # A rank only improves, so it can only move up within or into a top list.
+        for key in self._keys[movie_id]:
+            for node in self._walk(key):
+                self._promote(node, movie_id)
+
+    def remove(self, movie_id: int):
+        movie_id = int(movie_id)
+        keys = self._keys.pop(movie_id, None)
+        if keys is None:
+            return
+        for key in keys:
+            path = self._walk(key)
+            terminal = self._terminal[path[-1]]
+            if terminal is not None:
+                terminal.discard(movie_id)
+            for node in reversed(path):
+                if movie_id in self._top[node]:
+                    self._recompute(node)
+        self._views.pop(movie_id, None)
+        self._entries.pop(movie_id, None)
+
+    def entry(self, movie_id: int) -> Optional[Tuple[str, str, str]]:
+        """Return ``(title, code, media_type)`` for an indexed movie."""
+        return self._entries.get(int(movie_id))
+
+    def complete(self, query: str, limit: int = 20) -> List[int]:
+        """Return up to ``limit`` ids whose title, title word or code starts with ``query``, most viewed first."""
+        q = normalize_title(query)
+        path = self._walk(q)
+        if len(path) <= min(len(q), self.max_depth):
+            return []
+        node = path[-1]
+        if len(q) <= self.max_depth:
+            return self._top[node][: int(limit)]
+        matches = {
+            movie_id
+            for movie_id in self._subtree_ids(node)
+            if any(key.startswith(q) for key in self._keys.get(movie_id, ()))
+        }
+        return sorted(matches, key=self._rank_key)[: int(limit)]
+
+    def _register(self, doc: dict) -> Optional[int]:
+        movie_id = int(doc["id"])
+        title = doc.get("title") or ""
+        words = _TOKEN_RE.findall(title.lower())
+        keys = {normalize_title(doc.get("code"))}
+        keys.update(normalize_title(" ".join(words[i:])) for i in range(len(words)))
+        keys.discard("")
+        if not keys:
+            return None
+        self._keys[movie_id] = tuple(sorted(keys))
+        self._views[movie_id] = int(doc.get("views") or 0)
+        self._entries[movie_id] = (title, str(doc.get("code") or ""), doc.get("media_type") or "movie")
+        return movie_id
+
+    def _walk(self, key: str, create: bool = False) -> List[int]:
+        """Return the node path for ``key`` (cut to ``max_depth``), starting at the root.
+
+        Without ``create`` the path stops early when ``key`` is not in the trie.
+        """
+        node = 0
+        path = [node]
+        for char in key[: self.max_depth]:
+            child = self._children[node].get(char)
+            if child is None:
+                if not create:
+                    break
+                child = len(self._children)
+                self._children.append({})
+                self._terminal.append(None)
+                self._top.append([])
+                self._children[node][char] = child
+            node = child
+            path.append(node)
+        return path
+
+    def _promote(self, node: int, movie_id: int):
+        top = self._top[node]
+        rank = self._rank_key
+        if movie_id not in top:
+            if len(top) >= self.top_k and rank(movie_id) >= rank(top[-1]):
+                return
+            top.append(movie_id)
+        top.sort(key=rank)
+        del top[self.top_k :]
+
+    def _terminal_at(self, node: int) -> Set[int]:
+        if self._terminal[node] is None:
+            self._terminal[node] = set()
+        return self._terminal[node]
+
+    def _recompute(self, node: int):
+        candidates = set(self._terminal[node] or ())
+        for child in self._children[node].values():
+            candidates.update(self._top[child])
+        self._top[node] = heapq.nsmallest(self.top_k, candidates, key=self._rank_key)
+
+    def _subtree_ids(self, node: int) -> Set[int]:
+        ids: Set[int] = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            ids.update(self._terminal[current] or ())
+            stack.extend(self._children[current].values())
+        return ids
+
+    def _rank_key(self, movie_id: int) -> Tuple[int, int]:
+        return -self._views.get(movie_id, 0), movie_id
+
+
+class CategorySampler:
+    """Per-category arrays of active movie ids for O(k) random picks.
+
+    Each category keeps a dense id list plus an id -> position map, so
+    ``add`` appends and ``remove`` swaps the last id into the hole; both are
+    O(1). ``sample`` draws positions with ``random.sample`` and never looks
+    at the rest of the category.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._ids: Dict[str, List[int]] = {}
+        self._slot: Dict[int, Tuple[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._slot)
+
+    def load(self, docs: Iterable[dict]):
+        self._ids = {}
+        self._slot = {}
+        for doc in docs:
+            self.add(doc)
+        self.ready = True
+
+    def add(self, doc: dict):
+        if doc.get("id") is None or doc.get("is_active", 1) != 1:
+            return
+        movie_id = int(doc["id"])
+        self.remove(movie_id)
+        category = doc.get("category") or ""
+        ids = self._ids.setdefault(category, [])
+        self._slot[movie_id] = (category, len(ids))
+        ids.append(movie_id)
+
+    def remove(self, movie_id: int):
+        slot = self._slot.pop(int(movie_id), None)
+        if slot is None:
+            return
+        category, position = slot
+        ids = self._ids[category]
+        last = ids.pop()
+        if position < len(ids):
+            ids[position] = last
+            self._slot[last] = (category, position)
+
+    def sample(self, category: str, k: int, exclude: Optional[int] = None) -> List[int]:
+        ids = self._ids.get(category or "", [])
+        k = int(k)
+        if k <= 0 or not ids:
+            return []
+        picks = random.sample(range(len(ids)), min(len(ids), k + 1))
+        return [ids[position] for position in picks if ids[position] != exclude][:k]